@@ -0,0 +1,109 @@
+"""
+Micro-batching scheduler for model generation.
+
+Callers from concurrent requests submit prompts with a key (the kind of
+generation and its settings); one scheduler thread coalesces everything that
+arrives within BATCH_MAX_WAIT_MS, groups it by key and similar prompt length,
+runs batches of at most max_batch prompts and hands each caller its own results.
+Because a single thread drives the models, requests can run concurrently
+without two generate() calls ever sharing a model.
+
+QUIZ_BATCHING=0 runs every call inline in the caller's thread instead.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+BATCHING_ENABLED = os.environ.get("QUIZ_BATCHING", "1") != "0"
+BATCH_MAX_WAIT_MS = float(os.environ.get("QUIZ_BATCH_MAX_WAIT_MS", "10"))
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch=8, max_wait_ms=BATCH_MAX_WAIT_MS,
+                 enabled=BATCHING_ENABLED, name="generation"):
+        """run_batch(prompts, key) -> one result per prompt, in order."""
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.enabled = enabled
+        self.pending = []  # (arrival time, key, prompt, future)
+        self.cond = threading.Condition()
+        self.stats = {"batches": 0, "prompts": 0, "max_batch_seen": 0}
+
+        if enabled:
+            threading.Thread(target=self.loop, name=f"{name}-batcher", daemon=True).start()
+
+    def submit_many(self, prompts, key=None):
+        """Generate for all prompts (blocking) and return results in input order."""
+        if not prompts:
+            return []
+        if not self.enabled:
+            return self.run_grouped([(key, p) for p in prompts])
+
+        futures = [Future() for _ in prompts]
+        now = time.perf_counter()
+        with self.cond:
+            self.pending.extend((now, key, p, f) for p, f in zip(prompts, futures))
+            self.cond.notify()
+        return [f.result() for f in futures]
+
+    def batches(self, requests):
+        """Split (key, prompt, ...) requests into batches of one key and similar length."""
+        groups = {}
+        for req in requests:
+            groups.setdefault(req[0], []).append(req)
+
+        for key, group in groups.items():
+            group.sort(key=lambda req: len(req[1]))
+            for start in range(0, len(group), self.max_batch):
+                yield key, group[start:start + self.max_batch]
+
+    def run_grouped(self, requests):
+        """Inline path: run (key, prompt) requests batch by batch, results in input order."""
+        indexed = [(key, prompt, i) for i, (key, prompt) in enumerate(requests)]
+        results = [None] * len(indexed)
+        for key, batch in self.batches(indexed):
+            outputs = self.run_batch([prompt for _, prompt, _ in batch], key)
+            self.record(len(batch))
+            for (_, _, i), out in zip(batch, outputs):
+                results[i] = out
+        return results
+
+    def record(self, size):
+        self.stats["batches"] += 1
+        self.stats["prompts"] += size
+        self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], size)
+
+    def take(self):
+        """Wait for work, then for the batch window, and take everything pending."""
+        with self.cond:
+            while not self.pending:
+                self.cond.wait()
+
+            deadline = self.pending[0][0] + self.max_wait
+            while len(self.pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            taken, self.pending = self.pending, []
+        return taken
+
+    def loop(self):
+        while True:
+            taken = self.take()
+            requests = [(key, prompt, future) for _, key, prompt, future in taken]
+
+            for key, batch in self.batches(requests):
+                try:
+                    outputs = self.run_batch([prompt for _, prompt, _ in batch], key)
+                except Exception as e:
+                    for _, _, future in batch:
+                        future.set_exception(e)
+                    continue
+
+                self.record(len(batch))
+                for (_, _, future), out in zip(batch, outputs):
+                    future.set_result(out)
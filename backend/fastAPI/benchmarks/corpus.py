@@ -0,0 +1,170 @@
+"""
+Deterministic synthetic benchmark corpus.
+
+Lecture-style documents (numbered chapters/sections, entity-rich sentences
+and a share of near-duplicate sentences) are generated from a seed, then
+rendered to a text-layer PDF and to a scanned (image-only) PDF, so the
+corpus is reproducible without shipping binary files.
+"""
+import os
+import random
+
+TOPICS = [
+    {
+        "title": "The French Revolution",
+        "subjects": ["The National Assembly", "Maximilien Robespierre", "The Committee of Public Safety",
+                     "King Louis XVI", "The Third Estate", "The Jacobin Club"],
+        "places": ["Paris", "Versailles", "Lyon", "Marseille"],
+        "things": ["the Declaration of the Rights of Man", "the new constitution", "the Reign of Terror",
+                   "the assignat currency", "the tax reform"],
+    },
+    {
+        "title": "Cell Biology",
+        "subjects": ["The mitochondrion", "The cell membrane", "The ribosome", "The nucleus",
+                     "The Golgi apparatus", "The endoplasmic reticulum"],
+        "places": ["the cytoplasm", "plant cells", "animal cells", "the bloodstream"],
+        "things": ["adenosine triphosphate", "protein synthesis", "cellular respiration",
+                   "the lipid bilayer", "messenger RNA"],
+    },
+    {
+        "title": "Computer Networks",
+        "subjects": ["The TCP protocol", "The IP layer", "The DNS resolver", "The Ethernet switch",
+                     "The BGP router", "The HTTP server"],
+        "places": ["the data link layer", "the transport layer", "a local area network", "the Internet backbone"],
+        "things": ["congestion control", "packet routing", "the three-way handshake",
+                   "address resolution", "error detection"],
+    },
+    {
+        "title": "Economic History",
+        "subjects": ["The Bretton Woods system", "The Federal Reserve", "John Maynard Keynes",
+                     "The Marshall Plan", "The Great Depression", "The World Bank"],
+        "places": ["the United States", "Western Europe", "Japan", "Latin America"],
+        "things": ["the gold standard", "fiscal stimulus", "post-war reconstruction",
+                   "exchange rate stability", "industrial output"],
+    },
+]
+
+TEMPLATES = [
+    "{subject} played a central role in {thing} in {place} during {year}.",
+    "In {year}, {subject} introduced {thing}, which changed how {place} was organized.",
+    "Historians and scientists often describe {thing} as the main contribution of {subject}.",
+    "{subject} was studied in {place}, where researchers measured {number} separate cases of {thing}.",
+    "By {year}, more than {number} institutions in {place} had adopted {thing}.",
+    "{subject} depends on {thing} to function correctly in {place}.",
+    "The relationship between {subject} and {thing} was first documented in {year}.",
+    "Critics argued that {thing} in {place} could not be explained by {subject} alone.",
+]
+
+
+def make_sentence(rng, topic):
+    return rng.choice(TEMPLATES).format(
+        subject=rng.choice(topic["subjects"]),
+        thing=rng.choice(topic["things"]),
+        place=rng.choice(topic["places"]),
+        year=rng.randint(1700, 2020),
+        number=rng.randint(2, 900),
+    )
+
+
+def synthetic_document(seed=0, chapters=3, sections=4, paragraphs=3, sentences=6, duplicate_rate=0.15):
+    """Return lecture-style text with numbered headings, one line per paragraph."""
+    rng = random.Random(seed)
+    lines = []
+    for c in range(1, chapters + 1):
+        topic = TOPICS[(seed + c) % len(TOPICS)]
+        lines.append(f"{c} {topic['title']}")
+        for s in range(1, sections + 1):
+            lines.append(f"{c}.{s} {topic['title']}: part {s}")
+            previous = []
+            for _ in range(paragraphs):
+                para = []
+                for _ in range(sentences):
+                    if previous and rng.random() < duplicate_rate:
+                        # Near-duplicate of an earlier sentence, to exercise de-duplication
+                        para.append(rng.choice(previous).replace(" was ", " had been ", 1))
+                    else:
+                        sent = make_sentence(rng, topic)
+                        previous.append(sent)
+                        para.append(sent)
+                lines.append(" ".join(para))
+    return "\n".join(lines)
+
+
+def write_text_pdf(text, path, lines_per_page=40):
+    import fitz
+
+    doc = fitz.open()
+    lines = []
+    for line in text.split("\n"):
+        # Wrap long paragraphs so each page holds about lines_per_page lines
+        words = line.split()
+        current = []
+        for w in words:
+            current.append(w)
+            if len(" ".join(current)) > 90:
+                lines.append(" ".join(current))
+                current = []
+        if current:
+            lines.append(" ".join(current))
+
+    for start in range(0, len(lines), lines_per_page):
+        page = doc.new_page()
+        rect = fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50)
+        page.insert_textbox(rect, "\n".join(lines[start:start + lines_per_page]), fontsize=10)
+
+    doc.save(path)
+    doc.close()
+
+
+def write_scanned_pdf(text_pdf_path, path, dpi=150):
+    """Rasterize every page so the PDF has no text layer and needs OCR."""
+    import fitz
+
+    src = fitz.open(text_pdf_path)
+    out = fitz.open()
+    for page in src:
+        pix = page.get_pixmap(dpi=dpi)
+        new_page = out.new_page(width=page.rect.width, height=page.rect.height)
+        new_page.insert_image(new_page.rect, pixmap=pix)
+    out.save(path)
+    out.close()
+    src.close()
+
+
+CORPUS_SIZES = {
+    "small": [{"seed": 1, "chapters": 2, "sections": 3}],
+    "medium": [{"seed": 1, "chapters": 2, "sections": 3}, {"seed": 2, "chapters": 4, "sections": 5}],
+    "large": [{"seed": 1, "chapters": 2, "sections": 3}, {"seed": 2, "chapters": 4, "sections": 5},
+              {"seed": 3, "chapters": 8, "sections": 6}],
+}
+
+
+def build_corpus(out_dir, size="small", scanned=True):
+    """
+    Write the corpus to out_dir (reusing files already there) and return a
+    list of {"name", "kind", "path"} entries; kind is text, text_pdf or scanned_pdf.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+    for spec in CORPUS_SIZES[size]:
+        name = f"doc{spec['seed']}_{spec['chapters']}x{spec['sections']}"
+        text_path = os.path.join(out_dir, f"{name}.txt")
+        pdf_path = os.path.join(out_dir, f"{name}.pdf")
+        scan_path = os.path.join(out_dir, f"{name}_scanned.pdf")
+
+        if not os.path.exists(text_path):
+            with open(text_path, "w", encoding="utf-8") as f:
+                f.write(synthetic_document(**spec))
+        entries.append({"name": name, "kind": "text", "path": text_path})
+
+        if not os.path.exists(pdf_path):
+            with open(text_path, "r", encoding="utf-8") as f:
+                write_text_pdf(f.read(), pdf_path)
+        entries.append({"name": f"{name}.pdf", "kind": "text_pdf", "path": pdf_path})
+
+        if scanned:
+            if not os.path.exists(scan_path):
+                write_scanned_pdf(pdf_path, scan_path)
+            entries.append({"name": f"{name}_scanned.pdf", "kind": "scanned_pdf", "path": scan_path})
+
+    return entries
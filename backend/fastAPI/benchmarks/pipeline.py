@@ -0,0 +1,249 @@
+"""
+PDF -> quiz pipeline benchmark with per-stage timing.
+
+Runs the synthetic corpus (benchmarks/corpus.py) through page extraction /
+OCR, normalize_text + clean_layout, hierarchical chunking, sentence
+splitting, semantic de-duplication, windowing and, unless --no-models,
+answer extraction, question generation, distractor sampling and MMR.
+Reports stage seconds, pages/s, questions/s and peak RSS, and compares two
+result files to catch regressions.
+
+Run from backend/fastAPI:
+    python -m benchmarks.pipeline run --size small --out bench_new.json
+    python -m benchmarks.pipeline compare bench_old.json bench_new.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+from benchmarks.common import peak_rss_mb
+from benchmarks.corpus import build_corpus
+
+CORPUS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "bench_corpus"
+)
+
+STAGES = [
+    "page_extraction", "normalize", "chunking", "sentence_split", "dedup", "windowing",
+    "answer_extraction", "question_generation", "distractors", "mmr",
+]
+
+
+def run_document(entry, args, quiz_api=None):
+    import embedding_service
+    from extract_text import (
+        extract_pdf_pages, pages_to_lines, lines_to_document, normalize_text, clean_layout, filter_report
+    )
+
+    # Every document starts with a cold embedding cache
+    embedding_service.cache.clear()
+
+    timings = {}
+    start = time.perf_counter()
+
+    if entry["kind"] == "text":
+        with open(entry["path"], "r", encoding="utf-8") as f:
+            raw = f.read()
+        t0 = time.perf_counter()
+        lines = clean_layout(normalize_text(raw)).split("\n")
+        line_pages = None
+        timings["normalize"] = time.perf_counter() - t0
+        pages = 0
+    else:
+        page_results = extract_pdf_pages(entry["path"], workers=args.workers, use_cache=False)
+        # Summed over pool workers, i.e. CPU seconds rather than wall time
+        timings["page_extraction"] = sum(p["extract_seconds"] for p in page_results)
+        timings["normalize"] = sum(p["normalize_seconds"] for p in page_results)
+        lines, line_pages = pages_to_lines(page_results)
+        pages = len(page_results)
+
+    filtered_before = filter_report()
+    document = lines_to_document(lines, line_pages, max_words=args.max_words, timings=timings)
+    filtering = {key: value - filtered_before[key] for key, value in filter_report().items()}
+    extraction_seconds = time.perf_counter() - start
+
+    questions = 0
+    quiz_seconds = None
+    truncation = None
+    distractors = None
+    answers = None
+    if quiz_api is not None:
+        import prompt_tokens
+        before = prompt_tokens.truncation_report()
+        dist_before = dict(quiz_api.distractor_stats)
+        answers_before = dict(quiz_api.answer_stats)
+        t0 = time.perf_counter()
+        quiz = list(quiz_api.iter_quiz_from_document(
+            document,
+            total_questions=args.questions,
+            timings=timings,
+            reuse_questions=False
+        ))
+        quiz_seconds = time.perf_counter() - t0
+        questions = len(quiz)
+        after = prompt_tokens.truncation_report()
+        truncation = {
+            key: after[key] - before[key]
+            for key in ["prompts", "truncated", "context_tokens", "context_tokens_dropped"]
+        }
+        distractors = {key: value - dist_before[key] for key, value in quiz_api.distractor_stats.items()}
+        answers = {key: value - answers_before[key] for key, value in quiz_api.answer_stats.items()}
+
+    return {
+        "name": entry["name"],
+        "kind": entry["kind"],
+        "pages": pages,
+        "contexts": len(document["contexts"]),
+        "questions": questions,
+        "stages": {k: round(v, 4) for k, v in timings.items()},
+        "extraction_seconds": round(extraction_seconds, 4),
+        "quiz_seconds": round(quiz_seconds, 4) if quiz_seconds is not None else None,
+        "pages_per_second": round(pages / extraction_seconds, 3) if pages and extraction_seconds else None,
+        "questions_per_second": round(questions / quiz_seconds, 3) if questions and quiz_seconds else None,
+        "prompt_truncation": truncation,
+        "filtering": filtering,
+        "answers": answers,
+        "distractors": distractors,
+        "peak_rss_mb_after": peak_rss_mb(),
+    }
+
+
+def run(args):
+    import embedding_service
+
+    random.seed(args.seed)
+    entries = build_corpus(CORPUS_DIR, size=args.size, scanned=not args.no_ocr)
+
+    # Load SBERT outside the timed stages
+    embedding_service.encode(["warm up"])
+
+    quiz_api = None
+    model_load_seconds = None
+    if not args.no_models:
+        t0 = time.perf_counter()
+        import quiz_api
+        model_load_seconds = round(time.perf_counter() - t0, 2)
+        import torch
+        torch.manual_seed(args.seed)
+
+    documents = []
+    for entry in entries:
+        print(f"Benchmarking {entry['name']} ({entry['kind']})...", flush=True)
+        documents.append(run_document(entry, args, quiz_api))
+
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "size": args.size,
+            "workers": args.workers,
+            "questions": args.questions,
+            "models": not args.no_models,
+            "model_load_seconds": model_load_seconds,
+        },
+        "documents": documents,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_report(results):
+    stages = [s for s in STAGES if any(s in d["stages"] for d in results["documents"])]
+    header = f"{'document':<28}" + "".join(f"{s[:12]:>13}" for s in stages) + f"{'pages/s':>9}{'q/s':>8}"
+    print(header)
+    print("-" * len(header))
+    for d in results["documents"]:
+        row = f"{d['name'][:27]:<28}"
+        row += "".join(f"{d['stages'].get(s, 0.0):>13.3f}" for s in stages)
+        row += f"{str(d['pages_per_second'] or '-'):>9}{str(d['questions_per_second'] or '-'):>8}"
+        print(row)
+    for d in results["documents"]:
+        t = d.get("prompt_truncation")
+        if t and t["truncated"]:
+            print(f"{d['name']}: {t['truncated']}/{t['prompts']} prompts truncated, "
+                  f"{t['context_tokens_dropped']} context tokens dropped (lower --max-words)")
+    print(f"Peak RSS: {results['peak_rss_mb']} MB")
+
+
+def compare(old, new, tolerance=0.10, min_seconds=0.05):
+    """Return a list of regression messages (slower stages, lower throughput, more memory)."""
+    regressions = []
+    old_docs = {d["name"]: d for d in old["documents"]}
+
+    for d in new["documents"]:
+        base = old_docs.get(d["name"])
+        if base is None:
+            continue
+
+        for stage, seconds in d["stages"].items():
+            before = base["stages"].get(stage)
+            if before is None or before < min_seconds:
+                continue
+            change = (seconds - before) / before
+            line = f"{d['name']} {stage}: {before:.3f}s -> {seconds:.3f}s ({change:+.1%})"
+            print(line)
+            if change > tolerance:
+                regressions.append(line)
+
+        for key in ["pages_per_second", "questions_per_second"]:
+            before, after = base.get(key), d.get(key)
+            if before and after and (before - after) / before > tolerance:
+                regressions.append(f"{d['name']} {key}: {before} -> {after}")
+
+    before, after = old.get("peak_rss_mb"), new.get("peak_rss_mb")
+    if before and after and (after - before) / before > tolerance:
+        regressions.append(f"peak_rss_mb: {before} -> {after}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="run the benchmark")
+    run_p.add_argument("--size", choices=["small", "medium", "large"], default="small")
+    run_p.add_argument("--out", help="write results JSON here")
+    run_p.add_argument("--workers", type=int, default=None, help="page extraction processes")
+    run_p.add_argument("--questions", type=int, default=20)
+    run_p.add_argument("--max-words", type=int, default=200)
+    run_p.add_argument("--seed", type=int, default=0)
+    run_p.add_argument("--no-models", action="store_true", help="skip the T5 / spaCy quiz stages")
+    run_p.add_argument("--no-ocr", action="store_true", help="skip the scanned PDFs")
+
+    cmp_p = sub.add_parser("compare", help="compare two result files")
+    cmp_p.add_argument("old")
+    cmp_p.add_argument("new")
+    cmp_p.add_argument("--tolerance", type=float, default=0.10)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(args)
+        print_report(results)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"Saved results to {args.out}")
+        return
+
+    with open(args.old, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, "r", encoding="utf-8") as f:
+        new = json.load(f)
+
+    regressions = compare(old, new, tolerance=args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.tolerance:.0%}:")
+        for r in regressions:
+            print(f"  {r}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
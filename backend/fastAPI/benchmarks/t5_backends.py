@@ -0,0 +1,164 @@
+"""
+Compare T5 inference backends (fp32 torch, int8, onnx) for the QAG model.
+
+Each backend runs in its own subprocess so load time and memory footprint
+are measured in isolation. Output quality is compared against the fp32
+torch outputs on the fixed prompts in benchmarks/data/qag_pairs.json.
+
+Run from backend/fastAPI:
+    python -m benchmarks.t5_backends --backends torch int8 onnx
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import peak_rss_mb, summarize
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "qag_pairs.json")
+
+
+def load_pairs(path=DATA_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_backend(backend, pairs):
+    import torch
+    from transformers import T5Tokenizer
+    from prompts import build_qag_prompt
+    from t5_backend import load_t5, QAG_MODEL_PATH, QAG_TOKENIZER_PATH, QAG_GENERATE_KWARGS
+
+    rss_start = peak_rss_mb()
+    start = time.perf_counter()
+    tokenizer = T5Tokenizer.from_pretrained(QAG_TOKENIZER_PATH)
+    model = load_t5(QAG_MODEL_PATH, backend=backend)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = peak_rss_mb()
+
+    prompts = [build_qag_prompt(p["context"], p["answer"]) for p in pairs]
+
+    def generate(prompt):
+        inputs = tokenizer(
+            prompt,
+            return_tensors="pt",
+            truncation=True,
+            max_length=512
+        ).to(model.device)
+        with torch.no_grad():
+            output = model.generate(**inputs, **QAG_GENERATE_KWARGS)
+        return tokenizer.decode(output[0], skip_special_tokens=True).strip()
+
+    generate(prompts[0])  # warm-up
+
+    latencies = []
+    outputs = []
+    for prompt in prompts:
+        t0 = time.perf_counter()
+        outputs.append(generate(prompt))
+        latencies.append(time.perf_counter() - t0)
+
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 2),
+        "rss_start_mb": rss_start,
+        "rss_after_load_mb": rss_loaded,
+        "peak_rss_mb": peak_rss_mb(),
+        "latency": summarize(latencies),
+        "outputs": outputs,
+    }
+
+
+def token_f1(pred, ref):
+    pred_tokens = pred.lower().split()
+    ref_tokens = ref.lower().split()
+    if not pred_tokens or not ref_tokens:
+        return float(pred_tokens == ref_tokens)
+    common = 0
+    remaining = list(ref_tokens)
+    for tok in pred_tokens:
+        if tok in remaining:
+            remaining.remove(tok)
+            common += 1
+    if not common:
+        return 0.0
+    precision = common / len(pred_tokens)
+    recall = common / len(ref_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def compare_to_reference(result, reference):
+    pairs = list(zip(result["outputs"], reference["outputs"]))
+    exact = sum(1 for a, b in pairs if a == b)
+    f1 = [token_f1(a, b) for a, b in pairs]
+    return {
+        "exact_match": round(exact / len(pairs), 3) if pairs else None,
+        "token_f1": round(sum(f1) / len(f1), 3) if f1 else None,
+    }
+
+
+def run_in_subprocess(backend):
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, f"{backend}.json")
+        cmd = [sys.executable, "-m", "benchmarks.t5_backends", "--child", backend, "--out", out_path]
+        proc = subprocess.run(cmd, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if proc.returncode != 0 or not os.path.exists(out_path):
+            return {"backend": backend, "error": f"exit code {proc.returncode}"}
+        with open(out_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def print_table(results):
+    header = f"{'backend':<8} {'load s':>7} {'rss MB':>8} {'peak MB':>8} {'mean s':>8} {'p95 s':>7} {'EM':>6} {'F1':>6}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        if "error" in r:
+            print(f"{r['backend']:<8} failed: {r['error']}")
+            continue
+        lat = r["latency"]
+        q = r.get("quality", {})
+        print(
+            f"{r['backend']:<8} {r['load_seconds']:>7} {str(r['rss_after_load_mb']):>8} "
+            f"{str(r['peak_rss_mb']):>8} {lat['mean']:>8} {lat['p95']:>7} "
+            f"{str(q.get('exact_match')):>6} {str(q.get('token_f1')):>6}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--json", help="write full results (with outputs) to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    pairs = load_pairs()
+
+    if args.child:
+        result = run_backend(args.child, pairs)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    # fp32 torch is always the quality reference
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    results = [run_in_subprocess(b) for b in backends]
+
+    reference = results[0]
+    for r in results:
+        if "error" not in r and "error" not in reference:
+            r["quality"] = compare_to_reference(r, reference)
+
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+SQLite store for extracted documents (replaces the <pdf>_processed.txt file).
+
+Each document is keyed like the old document cache (file sha256, pipeline
+version and chunking settings) and holds its sentences and contexts (title,
+page range, sentence ids). Context embeddings are computed the first time a
+query needs them and kept next to the context, so later quizzes from the same
+document select contexts by section, random or diverse sample without
+re-extracting or re-embedding anything.
+
+The least recently used documents are dropped past CONTEXT_STORE_MAX_DOCS.
+"""
+import json
+import os
+import random
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+
+from disk_cache import CACHE_DIR
+
+CONTEXT_DB_PATH = os.environ.get("QUIZ_CONTEXT_DB", os.path.join(CACHE_DIR, "contexts.sqlite"))
+CONTEXT_STORE_MAX_DOCS = int(os.environ.get("QUIZ_CONTEXT_STORE_MAX_DOCS", "200"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    source TEXT,
+    complete INTEGER NOT NULL DEFAULT 0,
+    sentence_count INTEGER NOT NULL DEFAULT 0,
+    context_count INTEGER NOT NULL DEFAULT 0,
+    used_at REAL
+);
+CREATE TABLE IF NOT EXISTS sentences (
+    doc_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    page INTEGER,
+    heading TEXT,
+    start_offset INTEGER,
+    end_offset INTEGER,
+    PRIMARY KEY (doc_id, id)
+);
+CREATE TABLE IF NOT EXISTS contexts (
+    doc_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    title TEXT,
+    text TEXT NOT NULL,
+    sentence_ids TEXT NOT NULL,
+    page_start INTEGER,
+    page_end INTEGER,
+    embedding BLOB,
+    PRIMARY KEY (doc_id, id)
+);
+CREATE INDEX IF NOT EXISTS contexts_title ON contexts (doc_id, title);
+"""
+
+CONTEXT_COLUMNS = "id, title, text, sentence_ids, page_start, page_end"
+
+
+def connect():
+    os.makedirs(os.path.dirname(os.path.abspath(CONTEXT_DB_PATH)), exist_ok=True)
+    conn = sqlite3.connect(CONTEXT_DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def context_record(row):
+    ctx_id, title, text, sentence_ids, page_start, page_end = row
+    return {
+        "id": ctx_id,
+        "title": title,
+        "text": text,
+        "sentence_ids": json.loads(sentence_ids),
+        "page_start": page_start,
+        "page_end": page_end,
+    }
+
+
+def delete_rows(conn, doc_id):
+    for table, column in (("sentences", "doc_id"), ("contexts", "doc_id"), ("documents", "id")):
+        conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (doc_id,))
+
+
+def begin_document(doc_id, source=None):
+    """Start (or restart) writing a document; it is not loadable until finish_document."""
+    with closing(connect()) as conn, conn:
+        delete_rows(conn, doc_id)
+        conn.execute(
+            "INSERT INTO documents (id, source, used_at) VALUES (?, ?, ?)",
+            (doc_id, source, time.time())
+        )
+
+
+def add_section(doc_id, section):
+    """Append a section's sentences and contexts (ids are global document ids)."""
+    with closing(connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO sentences VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (doc_id, s["id"], s["text"], s.get("page"), s.get("heading"), s.get("start"), s.get("end"))
+                for s in section["sentences"]
+            ]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO contexts (doc_id, id, title, text, sentence_ids, page_start, page_end) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (doc_id, c["id"], c.get("title"), c["text"], json.dumps(c["sentence_ids"]),
+                 c.get("page_start"), c.get("page_end"))
+                for c in section["contexts"]
+            ]
+        )
+        conn.execute(
+            "UPDATE documents SET sentence_count = sentence_count + ?, context_count = context_count + ? "
+            "WHERE id = ?",
+            (len(section["sentences"]), len(section["contexts"]), doc_id)
+        )
+
+
+def finish_document(doc_id):
+    with closing(connect()) as conn, conn:
+        conn.execute("UPDATE documents SET complete = 1, used_at = ? WHERE id = ?", (time.time(), doc_id))
+    evict_documents(CONTEXT_STORE_MAX_DOCS)
+
+
+def save_document(doc_id, document, source=None):
+    begin_document(doc_id, source)
+    add_section(doc_id, document)
+    finish_document(doc_id)
+
+
+def document_counts(doc_id):
+    """{"sentences", "contexts"} of a complete stored document, else None."""
+    with closing(connect()) as conn:
+        row = conn.execute(
+            "SELECT sentence_count, context_count FROM documents WHERE id = ? AND complete = 1", (doc_id,)
+        ).fetchone()
+    return {"sentences": row[0], "contexts": row[1]} if row else None
+
+
+def load_document(doc_id):
+    """The stored document ({"id", "sentences", "contexts"}) or None if absent/incomplete."""
+    with closing(connect()) as conn, conn:
+        if not conn.execute("SELECT complete FROM documents WHERE id = ? AND complete = 1", (doc_id,)).fetchone():
+            return None
+        conn.execute("UPDATE documents SET used_at = ? WHERE id = ?", (time.time(), doc_id))
+
+        sentences = [
+            {"id": i, "text": text, "page": page, "heading": heading, "start": start, "end": end}
+            for i, text, page, heading, start, end in conn.execute(
+                "SELECT id, text, page, heading, start_offset, end_offset FROM sentences "
+                "WHERE doc_id = ? ORDER BY id", (doc_id,)
+            )
+        ]
+        contexts = [
+            context_record(row) for row in conn.execute(
+                f"SELECT {CONTEXT_COLUMNS} FROM contexts WHERE doc_id = ? ORDER BY id", (doc_id,)
+            )
+        ]
+    return {"id": doc_id, "sentences": sentences, "contexts": contexts}
+
+
+def list_sections(doc_id):
+    """[(title, context count, first page)] in document order."""
+    with closing(connect()) as conn:
+        return conn.execute(
+            "SELECT title, COUNT(*), MIN(page_start) FROM contexts WHERE doc_id = ? "
+            "GROUP BY title ORDER BY MIN(id)", (doc_id,)
+        ).fetchall()
+
+
+def context_embeddings(doc_id, ids):
+    """
+    Float32 matrix of context embeddings, one row per id. Missing ones are
+    encoded in one batch and written back, so each context is embedded once.
+    """
+    import embedding_service
+
+    with closing(connect()) as conn, conn:
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            rows.update({
+                ctx_id: (text, blob) for ctx_id, text, blob in conn.execute(
+                    f"SELECT id, text, embedding FROM contexts WHERE doc_id = ? AND id IN ({marks})",
+                    (doc_id, *chunk)
+                )
+            })
+
+        missing = [ctx_id for ctx_id in ids if rows[ctx_id][1] is None]
+        if missing:
+            vectors = embedding_service.encode([rows[ctx_id][0] for ctx_id in missing])
+            vectors = vectors.cpu().numpy().astype(np.float32)
+            conn.executemany(
+                "UPDATE contexts SET embedding = ? WHERE doc_id = ? AND id = ?",
+                [(vec.tobytes(), doc_id, ctx_id) for ctx_id, vec in zip(missing, vectors)]
+            )
+            for ctx_id, vec in zip(missing, vectors):
+                rows[ctx_id] = (rows[ctx_id][0], vec.tobytes())
+
+    return np.stack([np.frombuffer(rows[ctx_id][1], dtype=np.float32) for ctx_id in ids])
+
+
+def diverse_sample(doc_id, ids, k, rng):
+    """Farthest-point sample of k ids: each pick is the context least similar to those chosen."""
+    vectors = context_embeddings(doc_id, ids)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    chosen = [rng.randrange(len(ids))]
+    closest = vectors @ vectors[chosen[0]]
+    while len(chosen) < k:
+        closest[chosen] = np.inf
+        pick = int(np.argmin(closest))
+        chosen.append(pick)
+        closest = np.maximum(closest, vectors @ vectors[pick])
+    return [ids[i] for i in sorted(chosen)]
+
+
+def select_contexts(doc_id, section=None, sample=None, diverse=False, seed=None):
+    """
+    Contexts of a stored document, in document order. `section` keeps a
+    heading and its subsections (titles are "A / B / C" paths); `sample` keeps
+    that many contexts at random, or spread over the document with diverse=True.
+    """
+    query = f"SELECT {CONTEXT_COLUMNS} FROM contexts WHERE doc_id = ?"
+    params = [doc_id]
+    if section:
+        query += " AND (title = ? OR title LIKE ? ESCAPE '\\')"
+        escaped = section.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params += [section, f"{escaped} / %"]
+
+    with closing(connect()) as conn:
+        contexts = [context_record(row) for row in conn.execute(query + " ORDER BY id", params)]
+
+    if sample is not None and sample < 0:
+        raise ValueError("sample must be >= 0")
+    if sample is None or sample >= len(contexts):
+        return contexts
+
+    rng = random.Random(seed)
+    ids = [ctx["id"] for ctx in contexts]
+    if diverse and sample > 0:
+        keep = set(diverse_sample(doc_id, ids, sample, rng))
+    else:
+        keep = set(rng.sample(ids, sample))
+    return [ctx for ctx in contexts if ctx["id"] in keep]
+
+
+def export_text(doc_id, output_path):
+    """Write the old _processed.txt layout, for inspecting a stored document."""
+    with closing(connect()) as conn, open(output_path, "w", encoding="utf-8") as f:
+        rows = conn.execute("SELECT text FROM contexts WHERE doc_id = ? ORDER BY id", (doc_id,))
+        for idx, (text,) in enumerate(rows, 1):
+            f.write(f"--- Chunk {idx} ---\n{text}\n\n")
+
+
+def evict_documents(max_docs):
+    with closing(connect()) as conn, conn:
+        stale = [
+            doc_id for (doc_id,) in conn.execute(
+                "SELECT id FROM documents WHERE complete = 1 ORDER BY used_at DESC LIMIT -1 OFFSET ?",
+                (max_docs,)
+            )
+        ]
+        for doc_id in stale:
+            delete_rows(conn, doc_id)
+
+    if stale:
+        print(f"Context store evicted {len(stale)} least recently used documents")
+
+
+def store_stats():
+    with closing(connect()) as conn:
+        documents, contexts = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(context_count), 0) FROM documents WHERE complete = 1"
+        ).fetchone()
+        embedded = conn.execute("SELECT COUNT(*) FROM contexts WHERE embedding IS NOT NULL").fetchone()[0]
+    return {"path": CONTEXT_DB_PATH, "documents": documents, "contexts": contexts, "embedded": embedded}
@@ -0,0 +1,103 @@
+"""
+Small persistent JSON cache on disk, content-addressed by sha256 keys.
+
+Entries live in CACHE_DIR/<namespace>/<key>.json. Reads refresh the file's
+mtime, and writes evict the least recently used entries once the whole
+cache grows past CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+CACHE_DIR = os.environ.get(
+    "QUIZ_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+CACHE_MAX_BYTES = int(os.environ.get("QUIZ_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def make_key(*parts) -> str:
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def entry_path(namespace: str, key: str) -> str:
+    return os.path.join(CACHE_DIR, namespace, f"{key}.json")
+
+
+def cache_get(namespace: str, key: str):
+    path = entry_path(namespace, key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    # Mark as recently used
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return value
+
+
+def cache_put(namespace: str, key: str, value, evict=True):
+    """Store a value; pass evict=False when writing many entries and call evict_lru once after."""
+    path = entry_path(namespace, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # A unique temp file per write: threads of one worker may store the same key at once
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if evict:
+        evict_lru(CACHE_MAX_BYTES)
+
+
+def evict_lru(max_bytes: int):
+    entries = []
+    total = 0
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    if total <= max_bytes:
+        return
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+    print(f"Cache evicted least recently used entries, now {total / 1024 / 1024:.1f} MB")
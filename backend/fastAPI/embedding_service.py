@@ -0,0 +1,78 @@
+"""
+Shared Sentence-BERT embedding service.
+
+One SBERT instance per process, used by both extract_text (semantic
+de-duplication) and quiz_api (MMR distractor selection), with an in-memory
+LRU cache keyed by text so repeated strings are never re-embedded.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+SBERT_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "50000"))
+
+model = None
+cache = OrderedDict()
+stats = {"hits": 0, "misses": 0}
+lock = threading.Lock()
+# Serializes model.encode: concurrent requests (quiz_server GENERATION_SLOTS)
+# share this one SBERT instance, which is not documented as thread-safe
+encode_lock = threading.Lock()
+
+
+def get_model():
+    """Load SBERT on first use (page-extraction workers never need it)."""
+    global model
+    with lock:
+        if model is None:
+            model = SentenceTransformer(SBERT_MODEL_NAME)
+    return model
+
+
+def encode(texts, batch_size=64):
+    """
+    Embed a string (-> 1D tensor) or a list of strings (-> 2D tensor, one row
+    per input). Only strings missing from the cache are sent to the model,
+    in a single batched call.
+    """
+    single = isinstance(texts, str)
+    if single:
+        texts = [texts]
+
+    found = {}
+    missing = {}  # text -> position in the model batch (dict keeps de-duplication O(n))
+    with lock:
+        for text in texts:
+            if text in found or text in missing:
+                continue
+            if text in cache:
+                cache.move_to_end(text)
+                found[text] = cache[text]
+                stats["hits"] += 1
+            else:
+                missing[text] = len(missing)
+        stats["misses"] += len(missing)
+
+    if missing:
+        model = get_model()
+        with encode_lock:
+            vectors = model.encode(
+                list(missing),
+                batch_size=batch_size,
+                convert_to_tensor=True
+            )
+        with lock:
+            for text, i in missing.items():
+                found[text] = cache[text] = vectors[i]
+            while len(cache) > EMBEDDING_CACHE_SIZE:
+                cache.popitem(last=False)
+
+    if not texts:
+        return torch.empty(0)
+
+    result = torch.stack([found[text] for text in texts])
+    return result[0] if single else result
@@ -1,56 +1,75 @@
 import os
+import sys
+import inspect
+import threading
+import hashlib
+from bisect import bisect_right
+from itertools import repeat
 import fitz  # PyMuPDF
-import pytesseract
-from PIL import Image
-from io import BytesIO
 import re
+from collections import defaultdict, deque
+import numpy as np
 import nltk
 from nltk.tokenize import sent_tokenize, word_tokenize
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import util
+import embedding_service
+import context_store
+from disk_cache import cache_get, cache_put, entry_path, evict_lru, file_sha256, make_key, CACHE_MAX_BYTES
+from stage_timer import timed
+from page_extract import (
+    PAGE_WORKERS, OCR_MODE, OCR_FULL_DPI, ocr_settings, is_page_text_based, render_page,
+    otsu_threshold, classify_page_image, ocr_image, extract_text_from_image_page, ocr_page,
+    normalize_text, clean_layout, extract_page_text, extract_page_range, get_page_pool
+)
 
 nltk.download("punkt", quiet=True)
 
-# Load Sentence-BERT
-sbert = SentenceTransformer("all-MiniLM-L6-v2")
+# Sentence-BERT comes from the shared embedding_service module, loaded on first use.
+# Page extraction and OCR live in page_extract, which the worker processes import.
+
+# Bump when cached contexts must be invalidated for a reason the source
+# fingerprint in pipeline_version() cannot see (e.g. a model change).
+CONTEXT_PIPELINE_VERSION = 2
+
+# Semantic de-duplication: rows of the similarity matrix computed per block
+# (memory ~ block * n floats), and the size from which "auto" switches to LSH.
+DEDUP_BLOCK_SIZE = 512
+APPROX_DEDUP_MIN_SENTENCES = 5000
+LSH_BITS = 8
+LSH_TABLES = 8
+
+
+# Context filtering (is_valid_context): one combined, precompiled matcher for
+# emails and metadata keywords instead of a scan per keyword, also run on
+# single sentences so sections that can only produce rejected contexts are
+# dropped before de-duplication and windowing.
+BANNED_CONTEXT_KEYWORDS = [
+    "introduction",
+    "author",
+    "student",
+    "supervisor",
+    "email",
+    "lecturer",
+    "university",
+    "faculty",
+    "course",
+    "chapter",
+    "table of contents"
+]
+CONTEXT_REJECT_RE = re.compile(
+    r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}|" + "|".join(re.escape(k) for k in BANNED_CONTEXT_KEYWORDS)
+)
+MIN_CONTEXT_WORDS = 30
+
+filter_lock = threading.Lock()
+filter_stats = {
+    "sections": 0,
+    "sections_too_short": 0,
+    "sections_all_flagged": 0,
+    "sentences_not_embedded": 0,
+    "contexts_prefiltered": 0,
+}
 
-def is_page_text_based(page):
-    return bool(page.get_text().strip())
-
-def extract_text_from_image_page(page, dpi=300, lang="eng"):
-    pix = page.get_pixmap(dpi=dpi)
-    img = Image.open(BytesIO(pix.tobytes("png")))
-    return pytesseract.image_to_string(img, lang=lang)
-
-def normalize_text(text: str) -> str:
-    text = re.sub(r"(\w+)-\s*\n\s*(\w+)", r"\1\2", text)  # nối từ bị gạch dòng
-    text = re.sub(r"\n+", "\n", text)                    # giữ newline để xử lý layout
-    text = re.sub(r"\s{2,}", " ", text)
-    text = text.replace('“', '"').replace('”', '"')
-    text = text.replace("‘", "'").replace("’", "'")
-    text = text.replace("–", "-").replace("—", "-")
-    return text.strip()
-
-def clean_layout(text: str) -> str:
-    lines = text.split("\n")
-    cleaned_lines = []
-
-    for line in lines:
-        line = line.strip()
-
-        # Remove page numbers (standalone digits)
-        if re.fullmatch(r"\d{1,3}", line):
-            continue
-
-        # Remove bullet symbols
-        line = re.sub(r"[•▪►●■]", "", line)
-
-        # Normalize whitespace
-        line = re.sub(r"\s+", " ", line)
-
-        if line:
-            cleaned_lines.append(line)
-
-    return "\n".join(cleaned_lines)
 
 def reconstruct_sentences(text: str) -> list:
     lines = text.split("\n")
@@ -76,21 +95,90 @@ def reconstruct_sentences(text: str) -> list:
 
     return sentences
 
-def remove_semantic_duplicates(sentences, threshold=0.85):
-    if len(sentences) <= 1:
-        return sentences
+def greedy_keep_exact(embeddings, threshold, block_size=DEDUP_BLOCK_SIZE):
+    """
+    Same decisions as the pairwise loop: walk sentences in order and drop every
+    later sentence too similar to a kept one. Similarities are computed one
+    block of rows at a time against the remaining columns.
+    """
+    n = len(embeddings)
+    keep = np.ones(n, dtype=bool)
+
+    for b0 in range(0, n, block_size):
+        b1 = min(n, b0 + block_size)
+        dup = (util.cos_sim(embeddings[b0:b1], embeddings[b0:]) > threshold).cpu().numpy()
+
+        for i in range(b0, b1):
+            if not keep[i]:
+                continue
+            row = dup[i - b0, i - b0 + 1:]
+            if row.any():
+                keep[i + 1:] &= ~row
+
+    return keep
 
-    embeddings = sbert.encode(sentences, convert_to_tensor=True)
-    keep = [True] * len(sentences)
 
-    for i in range(len(sentences)):
+def greedy_keep_lsh(embeddings, threshold, n_bits=LSH_BITS, n_tables=LSH_TABLES, seed=0):
+    """
+    Approximate greedy de-duplication with random-hyperplane LSH: only
+    sentences sharing a bucket are compared. It may miss some duplicates but
+    never drops a sentence that is not above the threshold.
+    """
+    emb = embeddings.cpu().numpy().astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True) + 1e-12
+    n, dim = emb.shape
+
+    rng = np.random.default_rng(seed)
+    powers = 1 << np.arange(n_bits)
+    signatures = []
+    buckets = defaultdict(list)
+    for t in range(n_tables):
+        planes = rng.standard_normal((dim, n_bits)).astype(np.float32)
+        codes = ((emb @ planes) > 0).astype(np.int64) @ powers
+        signatures.append(codes)
+        for idx, code in enumerate(codes):
+            buckets[(t, int(code))].append(idx)
+
+    keep = np.ones(n, dtype=bool)
+    for i in range(n):
         if not keep[i]:
             continue
-        for j in range(i + 1, len(sentences)):
-            sim = util.cos_sim(embeddings[i], embeddings[j])
-            if sim > threshold:
-                keep[j] = False
+        candidates = set()
+        for t in range(n_tables):
+            candidates.update(buckets[(t, int(signatures[t][i]))])
+        candidates = [j for j in candidates if j > i and keep[j]]
+        if not candidates:
+            continue
+        candidates = np.array(candidates)
+        sims = emb[candidates] @ emb[i]
+        keep[candidates[sims > threshold]] = False
+
+    return keep
+
+
+def semantic_keep_mask(sentences, threshold=0.85, mode="auto"):
+    """
+    Keep/drop flag per sentence. mode: "exact" (blocked similarity matrix),
+    "approx" (LSH) or "auto", which uses LSH from APPROX_DEDUP_MIN_SENTENCES on.
+    """
+    if len(sentences) <= 1:
+        return [True] * len(sentences)
+
+    if mode == "auto":
+        mode = "approx" if len(sentences) >= APPROX_DEDUP_MIN_SENTENCES else "exact"
 
+    embeddings = embedding_service.encode(sentences)
+
+    if mode == "approx":
+        return greedy_keep_lsh(embeddings, threshold)
+    return greedy_keep_exact(embeddings, threshold)
+
+
+def remove_semantic_duplicates(sentences, threshold=0.85, mode="auto"):
+    if len(sentences) <= 1:
+        return sentences
+
+    keep = semantic_keep_mask(sentences, threshold=threshold, mode=mode)
     return [s for s, k in zip(sentences, keep) if k]
 
 
@@ -113,64 +201,127 @@ def detect_heading_level(line: str) -> int:
     return 0
 
 
-def hierarchical_chunk_document(lines: list) -> list:
+def iter_hierarchical_chunks(lines, with_pages=False):
     """
-    Build chunks that respect the academic layout:
-    chapter -> section -> subsection -> paragraph.
+    Generator form of hierarchical_chunk_document over (line, page) pairs:
+    each chunk is yielded as soon as the next heading (or the end) closes it.
     """
-    chunks = []
     current_titles = []
     buffer = []
+    buffer_pages = []
 
-    def flush_buffer():
-        if not buffer:
-            return
+    def make_chunk():
         content = " ".join(buffer).strip()
-        if content:
-            title = " / ".join(current_titles) if current_titles else "Nội dung"
-            chunks.append({"title": title, "content": content})
-        buffer.clear()
-
-    for line in lines:
+        if not content:
+            return None
+        title = " / ".join(current_titles) if current_titles else "Nội dung"
+        chunk = {"title": title, "content": content}
+        if with_pages:
+            offsets = []
+            offset = 0
+            for line, page in zip(buffer, buffer_pages):
+                offsets.append((offset, page))
+                offset += len(line) + 1
+            chunk["line_pages"] = offsets
+        return chunk
+
+    for line, page in lines:
         line = line.strip()
         if not line:
             continue
 
         level = detect_heading_level(line)
         if level:
-            flush_buffer()
+            chunk = make_chunk()
+            if chunk:
+                yield chunk
+            buffer.clear()
+            buffer_pages.clear()
             current_titles = current_titles[: level - 1]
             current_titles.append(line)
             continue
 
         buffer.append(line)
+        buffer_pages.append(page)
 
-    flush_buffer()
-    return chunks
+    chunk = make_chunk()
+    if chunk:
+        yield chunk
 
 
-def sentence_window_chunking(sentences, window_size=5, step=None):
+def hierarchical_chunk_document(lines: list, line_pages=None) -> list:
+    """
+    Build chunks that respect the academic layout:
+    chapter -> section -> subsection -> paragraph.
+    With `line_pages` (page number per line), each chunk also gets
+    "line_pages": [(offset in content, page), ...] for its lines.
+    """
+    pages = line_pages if line_pages is not None else repeat(None)
+    return list(iter_hierarchical_chunks(zip(lines, pages), with_pages=line_pages is not None))
+
+
+def split_chunk_sentences(chunk) -> list:
+    """
+    Tokenize a chunk once into sentence objects:
+    {"id", "text", "page", "heading", "start", "end"} (offsets into chunk content).
+    Ids are assigned by the caller.
+    """
+    content = chunk["content"]
+    line_pages = chunk.get("line_pages") or []
+    line_starts = [offset for offset, _ in line_pages]
+
+    sentences = []
+    cursor = 0
+    for text in reconstruct_sentences(content):
+        start = content.find(text, cursor)
+        if start < 0:
+            start = cursor
+        end = start + len(text)
+        cursor = end
+
+        page = None
+        if line_pages:
+            page = line_pages[max(0, bisect_right(line_starts, start) - 1)][1]
+
+        sentences.append({
+            "id": None,
+            "text": text,
+            "page": page,
+            "heading": chunk["title"],
+            "start": start,
+            "end": end
+        })
+    return sentences
+
+
+def sentence_window_ranges(count, window_size=5, step=None):
     if step is None:
         step = max(1, window_size // 2)
 
-    windows = []
-    for start in range(0, len(sentences), step):
-        window = sentences[start : start + window_size]
-        if window:
-            windows.append(" ".join(window))
-    return windows
+    return [
+        (start, min(count, start + window_size))
+        for start in range(0, count, step)
+    ]
 
 
-def build_contexts(sentences, max_words=200, min_sentences=2):
-    contexts = []
+def sentence_window_chunking(sentences, window_size=5, step=None):
+    return [
+        " ".join(sentences[start:end])
+        for start, end in sentence_window_ranges(len(sentences), window_size, step)
+    ]
+
+
+def build_context_groups(sentences, max_words=200, min_sentences=2, text=lambda s: s):
+    """Group consecutive sentences into runs of at most max_words words."""
+    groups = []
     current = []
     word_count = 0
 
     for sent in sentences:
-        sent_len = len(sent.split())
+        sent_len = len(text(sent).split())
         if word_count + sent_len > max_words:
             if len(current) >= min_sentences:
-                contexts.append(" ".join(current))
+                groups.append(current)
             current = [sent]
             word_count = sent_len
         else:
@@ -178,102 +329,598 @@ def build_contexts(sentences, max_words=200, min_sentences=2):
             word_count += sent_len
 
     if len(current) >= min_sentences:
-        contexts.append(" ".join(current))
+        groups.append(current)
+
+    return groups
 
-    return contexts
+
+def build_contexts(sentences, max_words=200, min_sentences=2):
+    return [
+        " ".join(group)
+        for group in build_context_groups(sentences, max_words, min_sentences)
+    ]
 
 
 def is_valid_context(context: str) -> bool:
     body = context.split("\n", 1)[-1]
     text = body.lower()
 
-    # 1. Remove email-heavy contexts
-    if re.search(r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}", text):
-        return False
-
-    # 2. Remove introduction / metadata
-    banned_keywords = [
-        "introduction",
-        "author",
-        "student",
-        "supervisor",
-        "email",
-        "lecturer",
-        "university",
-        "faculty",
-        "course",
-        "chapter",
-        "table of contents"
-    ]
-    if any(k in text for k in banned_keywords):
+    # 1-2. Email-heavy contexts and introduction / metadata
+    if CONTEXT_REJECT_RE.search(text):
         return False
 
     # 3. Too short → not reading content
-    if len(text.split()) < 30:
+    if len(text.split()) < MIN_CONTEXT_WORDS:
         return False
 
     return True
 
+
+def sentence_flags(sentences) -> list:
+    """
+    Per sentence: does it trip CONTEXT_REJECT_RE? A context containing a
+    flagged sentence always fails is_valid_context.
+    """
+    return [bool(CONTEXT_REJECT_RE.search(sent["text"].lower())) for sent in sentences]
+
+
+def count_filtered(**counts):
+    with filter_lock:
+        for name, value in counts.items():
+            filter_stats[name] += value
+
+
+def filter_report() -> dict:
+    with filter_lock:
+        return dict(filter_stats)
+
+def write_context(f, idx, ctx):
+    f.write(f"--- Chunk {idx} ---\n{ctx}\n\n")
+
+
 def save_contexts_to_file(contexts, output_path):
     with open(output_path, "w", encoding="utf-8") as f:
         for idx, ctx in enumerate(contexts, 1):
-            f.write(f"--- Chunk {idx} ---\n{ctx}\n\n")
+            write_context(f, idx, ctx)
+
+
+def report_page_timings(pages):
+    total = len(pages)
+    for p in pages:
+        kind = "cached" if p.get("cached") else "ocr" if p["ocr"] else "text"
+        detail = ""
+        if p.get("skipped"):
+            detail = f", skipped {p['skipped']} page"
+        elif p["ocr"] and p.get("ocr_confidence") is not None:
+            detail = f", {p['ocr_dpi']} dpi, confidence {p['ocr_confidence']:.0f}"
+        print(f"Processed page {p['page']+1}/{total} ({kind}{detail}) in {p['seconds']:.2f}s")
+
+    page_time = sum(p["seconds"] for p in pages)
+    ocr_pages = [p for p in pages if p["ocr"]]
+    ocr_time = sum(p.get("ocr_seconds", 0.0) for p in ocr_pages)
+    share = ocr_time / page_time * 100 if page_time else 0.0
+    skipped = sum(1 for p in ocr_pages if p.get("skipped"))
+    escalated = sum(1 for p in ocr_pages if p.get("ocr_dpi") == OCR_FULL_DPI and OCR_MODE == "adaptive")
+    print(f"OCR pages: {len(ocr_pages)}/{total} ({skipped} skipped, {escalated} at {OCR_FULL_DPI} dpi), "
+          f"OCR share of page time: {share:.1f}%")
+
+
+def page_fingerprint(doc, page) -> str:
+    """
+    Hash of what a page's extracted text depends on: size, text layer,
+    content stream and embedded images (for scanned pages). Cheap compared
+    to OCR, and stable when other pages of the file change.
+    """
+    h = hashlib.sha256()
+    h.update(repr(tuple(page.rect)).encode("utf-8"))
+    h.update(page.get_text().encode("utf-8"))
+    h.update(page.read_contents())
+    for img in page.get_images(full=True):
+        h.update(doc.xref_stream_raw(img[0]) or b"")
+    return h.hexdigest()
 
 
-def process_pdf_to_contexts(
-    filepath: str,
+PAGE_CACHED_FIELDS = ["text", "ocr", "ocr_confidence", "ocr_dpi", "skipped"]
+
+
+def page_ranges(indices, size):
+    """Group sorted page indices into contiguous [start, stop) ranges of at most `size` pages."""
+    ranges = []
+    for i in indices:
+        if ranges and ranges[-1][1] == i and i - ranges[-1][0] < size:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+    return ranges
+
+
+def iter_pdf_pages(filepath: str, ocr_lang="eng", workers=None, progress=None, use_cache=True, summary=None):
+    """
+    Yield every page result (text layer or OCR) in page order.
+    Pages to extract are split into contiguous ranges run in a process pool,
+    at most two ranges per worker ahead of the consumer, so only those pages
+    are held in memory. With use_cache, results are stored per page content
+    hash and only new or edited pages are extracted again.
+    `progress(pages_done=..., pages_total=...)` is called after each page and
+    `summary` (a list) receives each page's result without its text.
+    """
+    with fitz.open(filepath) as doc:
+        page_count = len(doc)
+        keys = []
+        if use_cache:
+            version = page_pipeline_version()
+            keys = [make_key(page_fingerprint(doc, page), ocr_lang, version) for page in doc]
+
+    hits = [os.path.exists(entry_path("pages", key)) for key in keys] or [False] * page_count
+    todo = [i for i in range(page_count) if not hits[i]]
+    if todo and len(todo) < page_count:
+        print(f"Reusing {page_count - len(todo)}/{page_count} unchanged pages, extracting {len(todo)}")
+
+    workers = max(1, min(workers or PAGE_WORKERS, len(todo)))
+    # Several small ranges per worker so slow OCR pages balance out
+    size = max(1, -(-len(todo) // (workers * 4)))
+    ranges = page_ranges(todo, size)
+    done = 0
+
+    def finished(page):
+        nonlocal done
+        done += 1
+        if keys and not page.get("cached"):
+            cache_put("pages", keys[page["page"]], {
+                k: v for k, v in page.items() if k in PAGE_CACHED_FIELDS
+            }, evict=False)
+        if summary is not None:
+            summary.append({k: v for k, v in page.items() if k != "text"})
+        if progress:
+            progress(pages_done=done, pages_total=page_count)
+        return page
+
+    pool = get_page_pool() if workers > 1 else None
+    in_flight = deque()
+    submitted = 0
+    try:
+        i = 0
+        while i < page_count:
+            if hits[i]:
+                cached = cache_get("pages", keys[i])
+                if cached is not None:
+                    yield finished({
+                        **cached, "page": i, "cached": True, "seconds": 0.0,
+                        "extract_seconds": 0.0, "normalize_seconds": 0.0, "ocr_seconds": 0.0
+                    })
+                else:
+                    # Evicted since the existence check
+                    yield finished(extract_page_range(filepath, i, i + 1, ocr_lang)[0])
+                i += 1
+                continue
+
+            # i starts the next range of pages to extract
+            if pool is None:
+                start, stop = ranges[submitted]
+                submitted += 1
+                result = extract_page_range(filepath, start, stop, ocr_lang)
+            else:
+                while submitted < len(ranges) and len(in_flight) < workers * 2:
+                    start, stop = ranges[submitted]
+                    in_flight.append(pool.submit(extract_page_range, filepath, start, stop, ocr_lang))
+                    submitted += 1
+                result = in_flight.popleft().result()
+
+            for page in result:
+                yield finished(page)
+            i += len(result)
+    finally:
+        # The pool is shared with other requests: only drop this document's queued ranges
+        for future in in_flight:
+            future.cancel()
+
+    if keys and todo:
+        evict_lru(CACHE_MAX_BYTES)
+
+
+def extract_pdf_pages(filepath: str, ocr_lang="eng", workers=None, progress=None, use_cache=True) -> list:
+    """All page results of a PDF, in page order (see iter_pdf_pages)."""
+    summary = []
+    pages = list(iter_pdf_pages(
+        filepath, ocr_lang=ocr_lang, workers=workers,
+        progress=progress, use_cache=use_cache, summary=summary
+    ))
+    report_page_timings(summary)
+    return pages
+
+
+def iter_page_lines(pages):
+    """(line, 1-based page) pairs; a blank line closes each page."""
+    for page in pages:
+        for line in page["text"].split("\n") + [""]:
+            yield line, page["page"] + 1
+
+
+def pages_to_lines(pages) -> tuple:
+    """Flatten extracted pages into lines plus the (1-based) page of each line."""
+    all_lines = []
+    line_pages = []
+
+    for page in pages:
+        lines = page["text"].split("\n") + [""]
+        all_lines.extend(lines)
+        line_pages.extend([page["page"] + 1] * len(lines))
+
+    return all_lines, line_pages
+
+
+def extract_pdf_lines(filepath: str, ocr_lang="eng", workers=None) -> list:
+    all_lines, _ = pages_to_lines(
+        extract_pdf_pages(filepath, ocr_lang=ocr_lang, workers=workers)
+    )
+    return all_lines
+
+
+def chunk_to_section(chunk, max_words=200, window_size=5, window_step=None, timings=None) -> dict:
+    """
+    One hierarchical chunk -> {"sentences", "contexts"} with sentence ids
+    local to the chunk (0..n-1); lines_to_document renumbers them.
+    """
+    with timed(timings, "sentence_split"):
+        sentences = split_chunk_sentences(chunk)
+
+    # Every context is a subset of these sentences: with fewer than
+    # MIN_CONTEXT_WORDS words in total, or a flagged sentence everywhere,
+    # none can pass is_valid_context, so skip embedding and windowing
+    with timed(timings, "filtering"):
+        flags = sentence_flags(sentences)
+        words = sum(len(sent["text"].split()) for sent in sentences)
+    count_filtered(sections=1)
+    if words < MIN_CONTEXT_WORDS or all(flags):
+        reason = "sections_too_short" if words < MIN_CONTEXT_WORDS else "sections_all_flagged"
+        count_filtered(**{reason: 1, "sentences_not_embedded": len(sentences)})
+        return {"sentences": [], "contexts": []}
+
+    with timed(timings, "dedup"):
+        keep = semantic_keep_mask([sent["text"] for sent in sentences])
+        sentences = [sent for sent, k in zip(sentences, keep) if k]
+        flags = [flag for flag, k in zip(flags, keep) if k]
+
+    for i, sent in enumerate(sentences):
+        sent["id"] = i
+
+    contexts = []
+    prefiltered = 0
+    with timed(timings, "windowing"):
+        for start, end in sentence_window_ranges(len(sentences), window_size, window_step):
+            window = sentences[start:end]
+            groups = build_context_groups(
+                window,
+                max_words=max_words,
+                text=lambda sent: sent["text"]
+            )
+
+            for group in groups or [window]:
+                if any(flags[sent["id"]] for sent in group):
+                    prefiltered += 1
+                    continue
+                chunk_text = f"{chunk['title']}\n" + " ".join(sent["text"] for sent in group)
+                if not is_valid_context(chunk_text):
+                    continue
+                pages = [sent["page"] for sent in group if sent["page"] is not None]
+                contexts.append({
+                    "title": chunk["title"],
+                    "text": chunk_text,
+                    "sentence_ids": [sent["id"] for sent in group],
+                    "page_start": min(pages) if pages else None,
+                    "page_end": max(pages) if pages else None
+                })
+    count_filtered(contexts_prefiltered=prefiltered)
+
+    return {"sentences": sentences, "contexts": contexts}
+
+
+def iter_document_sections(
+    chunks,
     max_words=200,
-    ocr_lang="eng",
     window_size=5,
     window_step=None,
-    output_path=None
+    timings=None,
+    use_cache=False
 ):
-    doc = fitz.open(filepath)
-    all_lines = []
+    """
+    Yield {"sentences", "contexts"} for each chunk as it arrives, with ids
+    numbered across the whole document. With use_cache, each section is
+    cached by its content, so only edited sections are split and
+    de-duplicated again.
+    """
+    version = pipeline_version() if use_cache else None
+    filtered_before = filter_report()
+    sentence_offset = 0
+    context_offset = 0
+    reused = 0
+    total = 0
+
+    for chunk in chunks:
+        total += 1
+        section = None
+        key = None
+        if use_cache:
+            key = make_key(chunk, max_words, window_size, window_step, version)
+            section = cache_get("sections", key)
+            reused += section is not None
+        if section is None:
+            section = chunk_to_section(chunk, max_words, window_size, window_step, timings)
+            if key:
+                cache_put("sections", key, section, evict=False)
+
+        sentences = [{**sent, "id": sentence_offset + sent["id"]} for sent in section["sentences"]]
+        contexts = [
+            {
+                **ctx,
+                "id": context_offset + j,
+                "sentence_ids": [sentence_offset + i for i in ctx["sentence_ids"]]
+            }
+            for j, ctx in enumerate(section["contexts"])
+        ]
+        sentence_offset += len(sentences)
+        context_offset += len(contexts)
+        yield {"sentences": sentences, "contexts": contexts}
+
+    if use_cache and reused < total:
+        evict_lru(CACHE_MAX_BYTES)
+    if reused:
+        print(f"Reused {reused}/{total} unchanged sections")
+    filtered = {k: v - filtered_before[k] for k, v in filter_report().items()}
+    rejected = filtered["sections_too_short"] + filtered["sections_all_flagged"]
+    if rejected:
+        # stderr: the text path also runs under `python -c ... print(json.dumps(...))`,
+        # whose stdout the Node fallback parses as JSON (totals stay in filter_report)
+        print(
+            f"Early filtering rejected {rejected}/{filtered['sections']} sections "
+            f"({filtered['sentences_not_embedded']} sentences not embedded)",
+            file=sys.stderr
+        )
+
+
+def lines_to_document(
+    all_lines: list,
+    line_pages=None,
+    max_words=200,
+    window_size=5,
+    window_step=None,
+    timings=None,
+    use_cache=False
+) -> dict:
+    """
+    Lines -> {"sentences": [...], "contexts": [...]}.
+    Sentences are tokenized once and carry text, page, heading and offsets;
+    each context record lists the ids of the sentences it is built from.
+    """
+    with timed(timings, "chunking"):
+        hierarchical_chunks = hierarchical_chunk_document(all_lines, line_pages)
+
+    document = {"sentences": [], "contexts": []}
+    for section in iter_document_sections(
+        hierarchical_chunks, max_words, window_size, window_step, timings, use_cache
+    ):
+        document["sentences"].extend(section["sentences"])
+        document["contexts"].extend(section["contexts"])
+    return document
+
+
+def lines_to_contexts(
+    all_lines: list,
+    max_words=200,
+    window_size=5,
+    window_step=None,
+    timings=None
+) -> list:
+    document = lines_to_document(
+        all_lines,
+        max_words=max_words,
+        window_size=window_size,
+        window_step=window_step,
+        timings=timings
+    )
+    return [ctx["text"] for ctx in document["contexts"]]
+
+
+def process_text_to_document(
+    text: str,
+    max_words=200,
+    window_size=5,
+    window_step=None
+) -> dict:
+    text = normalize_text(text)
+    text = clean_layout(text)
+    return lines_to_document(
+        text.split("\n"),
+        max_words=max_words,
+        window_size=window_size,
+        window_step=window_step
+    )
+
+
+def process_text_to_contexts(
+    text: str,
+    max_words=200,
+    window_size=5,
+    window_step=None
+) -> list:
+    document = process_text_to_document(
+        text,
+        max_words=max_words,
+        window_size=window_size,
+        window_step=window_step
+    )
+    return [ctx["text"] for ctx in document["contexts"]]
+
+
+def source_version(funcs) -> str:
+    """Manual version plus a hash of the given functions' source."""
+    try:
+        source = "".join(inspect.getsource(f) for f in funcs)
+    except (OSError, TypeError):
+        source = ""
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+    return f"{CONTEXT_PIPELINE_VERSION}-{digest}"
+
+
+def page_functions() -> list:
+    return [
+        is_page_text_based, render_page, otsu_threshold, classify_page_image, ocr_image,
+        extract_text_from_image_page, ocr_page,
+        normalize_text, clean_layout, extract_page_text, iter_page_lines
+    ]
 
-    for i, page in enumerate(doc):
-        print(f"Processing page {i+1}/{len(doc)}...")
 
-        text = page.get_text() if is_page_text_based(page) \
-               else extract_text_from_image_page(page, lang=ocr_lang)
+def page_pipeline_version() -> str:
+    """Cache version of per-page extraction results."""
+    return f"{source_version(page_functions())}-{ocr_settings()}"
 
-        text = normalize_text(text)
-        text = clean_layout(text)
 
-        all_lines.extend(text.split("\n"))
-        all_lines.append("")
+def pipeline_version() -> str:
+    """Cache version of documents and sections: page extraction plus text processing."""
+    return source_version(page_functions() + [
+        reconstruct_sentences, semantic_keep_mask, iter_hierarchical_chunks,
+        split_chunk_sentences, sentence_window_ranges, build_context_groups,
+        is_valid_context, chunk_to_section, iter_document_sections
+    ]) + f"-{ocr_settings()}"
 
-    hierarchical_chunks = hierarchical_chunk_document(all_lines)
-    all_contexts = []
 
-    for chunk in hierarchical_chunks:
-        sentences = reconstruct_sentences(chunk["content"])
-        sentences = remove_semantic_duplicates(sentences)
+def iter_pdf_sections(
+    filepath: str,
+    max_words=200,
+    ocr_lang="eng",
+    window_size=5,
+    window_step=None,
+    page_workers=None,
+    use_cache=True,
+    progress=None
+):
+    """
+    Streaming PDF -> sections. Pages flow through extraction and
+    normalization (in the page workers) and hierarchical chunking as
+    generators; each section is de-duplicated and windowed as soon as the
+    next heading closes it. Peak memory is bounded by the largest section
+    plus the pages in flight, not by the document.
+    """
+    summary = []
+    pages = iter_pdf_pages(
+        filepath, ocr_lang=ocr_lang, workers=page_workers,
+        progress=progress, use_cache=use_cache, summary=summary
+    )
+    chunks = iter_hierarchical_chunks(iter_page_lines(pages), with_pages=True)
+    yield from iter_document_sections(
+        chunks, max_words, window_size, window_step, use_cache=use_cache
+    )
+    report_page_timings(summary)
 
-        windows = sentence_window_chunking(
-            sentences,
-            window_size=window_size,
-            step=window_step
-        )
 
-        refined_windows = []
-        for window in windows:
-            refined = build_contexts(
-                reconstruct_sentences(window),
-                max_words=max_words
-            )
-            refined_windows.extend(refined or [window])
+def document_key(filepath, max_words, window_size, window_step, ocr_lang) -> str:
+    """Context store id: file content plus everything that shapes its contexts."""
+    return make_key(file_sha256(filepath), pipeline_version(), max_words, window_size, window_step, ocr_lang)
 
-        for window in refined_windows:
-            chunk_text = f"{chunk['title']}\n{window}"
-            if is_valid_context(chunk_text):
-                all_contexts.append(chunk_text)
 
-    if output_path is None:
-        base, _ = os.path.splitext(filepath)
-        output_path = f"{base}_processed.txt"
+def stream_pdf_to_store(
+    filepath: str,
+    max_words=200,
+    ocr_lang="eng",
+    window_size=5,
+    window_step=None,
+    page_workers=None,
+    use_cache=True,
+    progress=None
+) -> dict:
+    """
+    Write the contexts of a (very large) PDF to the context store section by
+    section, without holding the document in memory. Returns the document id
+    and counts.
+    """
+    doc_id = document_key(filepath, max_words, window_size, window_step, ocr_lang)
+    counts = context_store.document_counts(doc_id) if use_cache else None
+    if counts is not None:
+        print(f"{filepath} is already in the context store")
+        if progress:
+            progress(contexts=counts["contexts"])
+        return {"doc_id": doc_id, **counts}
+
+    contexts = 0
+    sentences = 0
+    context_store.begin_document(doc_id, source=filepath)
+    for section in iter_pdf_sections(
+        filepath, max_words=max_words, ocr_lang=ocr_lang, window_size=window_size,
+        window_step=window_step, page_workers=page_workers, use_cache=use_cache,
+        progress=progress
+    ):
+        context_store.add_section(doc_id, section)
+        sentences += len(section["sentences"])
+        contexts += len(section["contexts"])
+    context_store.finish_document(doc_id)
+
+    print(f"Stored {contexts} contexts for {filepath} in {context_store.CONTEXT_DB_PATH}")
+    if progress:
+        progress(contexts=contexts)
+    return {"doc_id": doc_id, "contexts": contexts, "sentences": sentences}
+
+
+def process_pdf_to_document(
+    filepath: str,
+    max_words=200,
+    ocr_lang="eng",
+    window_size=5,
+    window_step=None,
+    output_path=None,
+    page_workers=None,
+    use_cache=True,
+    progress=None
+) -> dict:
+    """
+    PDF -> document (see lines_to_document) with its context store id under
+    "id". Stored documents are reused when use_cache is on; output_path
+    additionally exports the contexts in the old _processed.txt layout.
+    `progress(**counts)` receives page and context counts as they are known.
+    """
+    doc_id = document_key(filepath, max_words, window_size, window_step, ocr_lang)
+    document = context_store.load_document(doc_id) if use_cache else None
+    if document is not None:
+        print(f"Loaded {len(document['contexts'])} stored contexts for {filepath}")
+    else:
+        # Unchanged pages and sections of an edited re-upload come from their own caches
+        document = {"id": doc_id, "sentences": [], "contexts": []}
+        for section in iter_pdf_sections(
+            filepath, max_words=max_words, ocr_lang=ocr_lang, window_size=window_size,
+            window_step=window_step, page_workers=page_workers, use_cache=use_cache,
+            progress=progress
+        ):
+            document["sentences"].extend(section["sentences"])
+            document["contexts"].extend(section["contexts"])
+        context_store.save_document(doc_id, document, source=filepath)
+
+    if output_path is not None:
+        save_contexts_to_file([ctx["text"] for ctx in document["contexts"]], output_path)
+        print(f"Saved processed chunks to: {output_path}")
+
+    if progress:
+        progress(contexts=len(document["contexts"]))
+
+    return document
 
-    save_contexts_to_file(all_contexts, output_path)
-    print(f"Saved processed chunks to: {output_path}")
 
-    return all_contexts
+def process_pdf_to_contexts(
+    filepath: str,
+    max_words=200,
+    ocr_lang="eng",
+    window_size=5,
+    window_step=None,
+    output_path=None,
+    page_workers=None,
+    use_cache=True
+):
+    document = process_pdf_to_document(
+        filepath,
+        max_words=max_words,
+        ocr_lang=ocr_lang,
+        window_size=window_size,
+        window_step=window_step,
+        output_path=output_path,
+        page_workers=page_workers,
+        use_cache=use_cache
+    )
+    return [ctx["text"] for ctx in document["contexts"]]
@@ -0,0 +1,239 @@
+"""
+Per-page PDF extraction: text layer or tesseract OCR, then normalize_text and
+clean_layout.
+
+Kept apart from extract_text so the page-extraction worker processes only
+import PyMuPDF, pytesseract and PIL, never torch, nltk or the context store.
+The pool is created once per process and shared by every request.
+"""
+import os
+import threading
+import time
+import re
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+
+# Page extraction / OCR process pool size (0 = one worker per core)
+PAGE_WORKERS = int(os.environ.get("PDF_PAGE_WORKERS", "0")) or os.cpu_count() or 1
+
+# OCR: "fixed" (default) OCRs every scanned page at OCR_FULL_DPI, like the
+# original pipeline. "adaptive" (opt-in) OCRs at OCR_FAST_DPI first and
+# re-runs at OCR_FULL_DPI when the mean word confidence is below
+# OCR_MIN_CONFIDENCE or a thumbnail shows little ink (small print). With
+# PDF_OCR_SKIP_PAGES=1 it also skips pages the thumbnail marks as blank or
+# figure-only, but only once the fast OCR pass finds no words on them. A text
+# layer shorter than TEXT_PAGE_MIN_CHARS on a page with images (a stray page
+# number on a scan) does not count as text-based.
+OCR_MODE = os.environ.get("PDF_OCR_MODE", "fixed")
+OCR_SKIP_PAGES = os.environ.get("PDF_OCR_SKIP_PAGES", "0") == "1"
+OCR_FAST_DPI = int(os.environ.get("PDF_OCR_FAST_DPI", "150"))
+OCR_FULL_DPI = int(os.environ.get("PDF_OCR_DPI", "300"))
+OCR_MIN_CONFIDENCE = float(os.environ.get("PDF_OCR_MIN_CONFIDENCE", "70"))
+TEXT_PAGE_MIN_CHARS = int(os.environ.get("PDF_TEXT_MIN_CHARS", "20"))
+THUMBNAIL_DPI = 72
+MIN_INK_CONTRAST = 32      # gray levels between darkest and lightest thumbnail pixel on a non-blank page
+BLANK_INK_RATIO = 0.002    # share of ink pixels (Otsu threshold) below which a page looks blank
+FIGURE_MIDTONE_RATIO = 0.4 # share of mid-gray pixels above which a page looks like a photo/figure
+
+
+def ocr_settings() -> str:
+    return f"{OCR_MODE}-{OCR_SKIP_PAGES}-{OCR_FAST_DPI}-{OCR_FULL_DPI}-{OCR_MIN_CONFIDENCE}-{TEXT_PAGE_MIN_CHARS}"
+
+
+def is_page_text_based(page, min_chars=TEXT_PAGE_MIN_CHARS):
+    text = page.get_text().strip()
+    if len(text) >= min_chars:
+        return True
+    # Nothing to OCR on a page without images, keep whatever text it has
+    return bool(text) and not page.get_images()
+
+
+def render_page(page, dpi, gray=False):
+    """Render straight from the pixmap's raw samples (no PNG encode/decode)."""
+    if gray:
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    pix = page.get_pixmap(dpi=dpi)
+    mode = "RGBA" if pix.alpha else "RGB"
+    return Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+
+
+def otsu_threshold(hist):
+    """Gray level that best separates ink from background (Otsu), from a 256-bin histogram."""
+    total = sum(hist)
+    total_sum = sum(level * count for level, count in enumerate(hist))
+    weight_bg = sum_bg = 0
+    best, threshold = -1.0, 0
+    for level, count in enumerate(hist):
+        weight_bg += count
+        sum_bg += level * count
+        weight_fg = total - weight_bg
+        if not weight_bg or not weight_fg:
+            continue
+        between = weight_bg * weight_fg * (sum_bg / weight_bg - (total_sum - sum_bg) / weight_fg) ** 2
+        if between > best:
+            best, threshold = between, level
+    return threshold + 1
+
+
+def classify_page_image(page):
+    """
+    "blank", "figure" or None from a grayscale thumbnail. Only a hint: pages
+    are never skipped on it alone (see ocr_page).
+    """
+    hist = render_page(page, THUMBNAIL_DPI, gray=True).histogram()
+    total = sum(hist)
+    levels = [level for level, count in enumerate(hist) if count]
+    if not total or levels[-1] - levels[0] < MIN_INK_CONTRAST:
+        return "blank"
+    if sum(hist[:otsu_threshold(hist)]) / total < BLANK_INK_RATIO:
+        return "blank"
+    if sum(hist[64:192]) / total > FIGURE_MIDTONE_RATIO:
+        return "figure"
+    return None
+
+
+def ocr_image(img, lang="eng"):
+    """
+    (text, mean word confidence 0-100 or None) from a single tesseract run.
+    The text is rebuilt from image_to_data's words with tesseract's own line
+    and paragraph breaks, as image_to_string lays it out.
+    """
+    data = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+    lines = []
+    confidences = []
+    last_line = last_par = None
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        par = (data["block_num"][i], data["par_num"][i])
+        line = par + (data["line_num"][i],)
+        if line != last_line:
+            if last_par is not None and par != last_par:
+                lines.append("")
+            lines.append(word)
+            last_line, last_par = line, par
+        else:
+            lines[-1] += " " + word
+        if float(data["conf"][i]) >= 0:
+            confidences.append(float(data["conf"][i]))
+
+    confidence = sum(confidences) / len(confidences) if confidences else None
+    return "\n".join(lines), confidence
+
+
+def extract_text_from_image_page(page, dpi=300, lang="eng"):
+    return pytesseract.image_to_string(render_page(page, dpi), lang=lang)
+
+
+def ocr_page(page, lang="eng") -> dict:
+    """
+    OCR a page without a usable text layer:
+    {"text", "confidence", "dpi", "skipped", "ocr_seconds"}.
+    """
+    start = time.perf_counter()
+    result = {"text": "", "confidence": None, "dpi": None, "skipped": None}
+
+    if OCR_MODE == "adaptive":
+        hint = classify_page_image(page)
+        text, conf = ocr_image(render_page(page, OCR_FAST_DPI), lang=lang)
+        result.update(text=text, confidence=conf, dpi=OCR_FAST_DPI)
+
+        if not text.strip() and hint and OCR_SKIP_PAGES:
+            result.update(text="", skipped=hint)
+        elif conf is None or conf < OCR_MIN_CONFIDENCE or hint == "blank":
+            # Low confidence, or little ink (small print): OCR again at full resolution
+            text, full_conf = ocr_image(render_page(page, OCR_FULL_DPI), lang=lang)
+            if full_conf is not None and (conf is None or full_conf >= conf or hint == "blank"):
+                result.update(text=text, confidence=full_conf, dpi=OCR_FULL_DPI)
+    else:
+        text = extract_text_from_image_page(page, dpi=OCR_FULL_DPI, lang=lang)
+        result.update(text=text, dpi=OCR_FULL_DPI)
+
+    result["ocr_seconds"] = time.perf_counter() - start
+    return result
+
+
+def normalize_text(text: str) -> str:
+    text = re.sub(r"(\w+)-\s*\n\s*(\w+)", r"\1\2", text)  # nối từ bị gạch dòng
+    text = re.sub(r"\n+", "\n", text)                    # giữ newline để xử lý layout
+    text = re.sub(r"\s{2,}", " ", text)
+    text = text.replace('“', '"').replace('”', '"')
+    text = text.replace("‘", "'").replace("’", "'")
+    text = text.replace("–", "-").replace("—", "-")
+    return text.strip()
+
+
+def clean_layout(text: str) -> str:
+    lines = text.split("\n")
+    cleaned_lines = []
+
+    for line in lines:
+        line = line.strip()
+
+        # Remove page numbers (standalone digits)
+        if re.fullmatch(r"\d{1,3}", line):
+            continue
+
+        # Remove bullet symbols
+        line = re.sub(r"[•▪►●■]", "", line)
+
+        # Normalize whitespace
+        line = re.sub(r"\s+", " ", line)
+
+        if line:
+            cleaned_lines.append(line)
+
+    return "\n".join(cleaned_lines)
+
+
+def extract_page_text(page, ocr_lang="eng") -> dict:
+    start = time.perf_counter()
+    ocr = not is_page_text_based(page)
+
+    ocr_info = {"text": page.get_text()} if not ocr else ocr_page(page, lang=ocr_lang)
+    text = ocr_info["text"]
+    extracted = time.perf_counter()
+
+    text = normalize_text(text)
+    text = clean_layout(text)
+    end = time.perf_counter()
+
+    return {
+        "page": page.number,
+        "text": text,
+        "ocr": ocr,
+        "ocr_confidence": ocr_info.get("confidence"),
+        "ocr_dpi": ocr_info.get("dpi"),
+        "skipped": ocr_info.get("skipped"),
+        "ocr_seconds": ocr_info.get("ocr_seconds", 0.0),
+        "seconds": end - start,
+        "extract_seconds": extracted - start,
+        "normalize_seconds": end - extracted
+    }
+
+
+def init_page_worker():
+    # One tesseract thread per process; the pool already uses every core
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def extract_page_range(filepath: str, start: int, stop: int, ocr_lang="eng") -> list:
+    """Pool worker: opens the document itself and extracts pages [start, stop)."""
+    with fitz.open(filepath) as doc:
+        return [extract_page_text(doc[i], ocr_lang=ocr_lang) for i in range(start, stop)]
+
+
+page_pool = None
+page_pool_lock = threading.Lock()
+
+
+def get_page_pool():
+    """The process-wide page-extraction pool (PAGE_WORKERS processes), started on first use."""
+    global page_pool
+    with page_pool_lock:
+        if page_pool is None:
+            page_pool = ProcessPoolExecutor(max_workers=PAGE_WORKERS, initializer=init_page_worker)
+    return page_pool
@@ -0,0 +1,91 @@
+"""
+Token-level prompt assembly for the T5 models.
+
+Prompt pieces (template text, answer, question, context) are tokenized once
+and their ids cached, so a context shared by several questions and by the
+distractor prompts is only tokenized the first time. Prompts are assembled
+from the cached ids; when a prompt is longer than PROMPT_MAX_TOKENS only the
+context is cut (never the answer or the instructions), and the stats record
+how often and by how much, to tune max_words against the encoder limit.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+PROMPT_MAX_TOKENS = int(os.environ.get("QUIZ_PROMPT_MAX_TOKENS", "512"))
+TOKEN_CACHE_SIZE = int(os.environ.get("QUIZ_TOKEN_CACHE_SIZE", "20000"))
+
+cache = OrderedDict()
+lock = threading.Lock()
+stats = {
+    "prompts": 0,
+    "truncated": 0,
+    "context_tokens": 0,
+    "context_tokens_dropped": 0,
+    "cache_hits": 0,
+    "cache_misses": 0,
+}
+
+
+def token_ids(tokenizer, text):
+    """Token ids of a prompt piece, without special tokens (cached)."""
+    key = (getattr(tokenizer, "name_or_path", id(tokenizer)), text)
+    with lock:
+        ids = cache.get(key)
+        if ids is not None:
+            cache.move_to_end(key)
+            stats["cache_hits"] += 1
+            return ids
+        stats["cache_misses"] += 1
+
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    with lock:
+        cache[key] = ids
+        while len(cache) > TOKEN_CACHE_SIZE:
+            cache.popitem(last=False)
+    return ids
+
+
+def assemble(tokenizer, segments, max_tokens=PROMPT_MAX_TOKENS):
+    """
+    Input ids for a prompt given as (text, is_context) segments. Every piece
+    starts after whitespace in the template, so the ids match tokenizing the
+    joined string; only the context is shortened to fit max_tokens.
+    """
+    pieces = [(token_ids(tokenizer, text), is_context) for text, is_context in segments]
+    fixed = sum(len(ids) for ids, is_context in pieces if not is_context) + 1  # + </s>
+    budget = max(0, max_tokens - fixed)
+
+    ids = []
+    truncated = False
+    for piece, is_context in pieces:
+        if is_context:
+            with lock:
+                stats["context_tokens"] += len(piece)
+                if len(piece) > budget:
+                    stats["context_tokens_dropped"] += len(piece) - budget
+            if len(piece) > budget:
+                truncated = True
+                piece = piece[:budget]
+            budget -= len(piece)
+        ids.extend(piece)
+
+    with lock:
+        stats["prompts"] += 1
+        stats["truncated"] += truncated
+
+    # Template, answer and question alone can still exceed the limit
+    return ids[:max_tokens - 1] + [tokenizer.eos_token_id]
+
+
+def pad_batch(tokenizer, batch):
+    """Pad a list of id lists into input_ids / attention_mask tensors."""
+    return tokenizer.pad({"input_ids": batch}, padding=True, return_tensors="pt")
+
+
+def truncation_report():
+    with lock:
+        snapshot = dict(stats)
+    prompts = snapshot["prompts"]
+    snapshot["truncated_share"] = round(snapshot["truncated"] / prompts, 4) if prompts else 0.0
+    return snapshot
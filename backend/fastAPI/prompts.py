@@ -0,0 +1,37 @@
+"""
+Prompt templates for the QAG and distractor T5 models.
+
+Each template is a list of (text, is_context) segments so prompt_tokens.py
+can tokenize the pieces separately and truncate only the context; the
+build_* functions join them into the plain prompt string.
+"""
+
+
+def qag_prompt_segments(context, answer):
+    return [
+        ("\nGenerate a question whose answer is the given answer.\nAnswer: ", False),
+        (answer, False),
+        ("\nContext: ", False),
+        (context, True),
+        ("\nQuestion:\n", False),
+    ]
+
+
+def distractor_prompt_segments(context, question, answer):
+    return [
+        ("\nGenerate plausible but incorrect distractors.\nQuestion: ", False),
+        (question, False),
+        ("\nCorrect answer: ", False),
+        (answer, False),
+        ("\nContext: ", False),
+        (context, True),
+        ("\nDistractors:\n", False),
+    ]
+
+
+def build_qag_prompt(context, answer):
+    return "".join(text for text, _ in qag_prompt_segments(context, answer))
+
+
+def build_distractor_prompt(context, question, answer):
+    return "".join(text for text, _ in distractor_prompt_segments(context, question, answer))
@@ -1,11 +1,25 @@
+import os
+import threading
+import time
 import torch
 import random
 import re
 import spacy
 import nltk
 from nltk.tokenize import sent_tokenize
-from transformers import T5Tokenizer, T5ForConditionalGeneration
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import util
+import embedding_service
+from prompts import qag_prompt_segments, distractor_prompt_segments
+from prompt_tokens import assemble, pad_batch
+from t5_backend import (
+    load_quiz_models, QAG_GENERATE_KWARGS, QAG_MODEL_PATH, DIST_MODEL_PATH,
+    T5_BACKEND, DISTRACTOR_MODEL_MODE
+)
+from extract_text import process_pdf_to_contexts, process_pdf_to_document, process_text_to_document
+from stage_timer import timed
+from disk_cache import cache_get, cache_put, evict_lru, make_key, CACHE_MAX_BYTES
+from batching import MicroBatcher
+import context_store
 
 # Set NLTK data path to use existing wordnet data
 nltk_data_path = r"C:\Users\MSIGF63\AppData\Roaming\nltk_data"
@@ -18,120 +32,807 @@ nltk.download("punkt", quiet=True)
 # Import wordnet after setting the path
 from nltk.corpus import wordnet as wn
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
+# Batched generation: prompts per generate() call (also across concurrent
+# requests, see batching.py), and how many contexts are planned together
+# before their questions are generated in one pass.
+QAG_BATCH_SIZE = int(os.environ.get("QAG_BATCH_SIZE", "8"))
+QAG_CONTEXT_WINDOW = int(os.environ.get("QAG_CONTEXT_WINDOW", "4"))
 
 # =========================
 # Load models
 # =========================
 
-# QAG model (FINETUNED)
-QAG_MODEL_PATH = "E:\code\backend\fastAPI\flan-t5-large"
-qag_tokenizer = T5Tokenizer.from_pretrained("./flan-t5-large")
-qag_model = T5ForConditionalGeneration.from_pretrained(QAG_MODEL_PATH).to(device)
-qag_model.eval()
+# Backend (fp32 torch / int8 / onnx) is chosen by QUIZ_T5_BACKEND, and whether
+# distractors use a second T5, the QAG model itself or a LoRA adapter on it by
+# QUIZ_DISTRACTOR_MODEL (see t5_backend.py)
 
-# Distractor model (BASE)
-dist_tokenizer = T5Tokenizer.from_pretrained("google/flan-t5-large")
-dist_model = T5ForConditionalGeneration.from_pretrained("google/flan-t5-large").to(device)
-dist_model.eval()
+# QAG model (FINETUNED) + distractor model (BASE, shared or adapter)
+qag_tokenizer, qag_model, dist_tokenizer, dist_model = load_quiz_models()
 
 # NLP tools
 nlp = spacy.load("en_core_web_sm")
-sbert = SentenceTransformer("all-MiniLM-L6-v2")
+sbert = embedding_service.get_model()
 
+# Document-level spaCy stage: sentences are parsed once with nlp.pipe and their
+# entity / noun-chunk spans cached, so overlapping windows are not re-parsed.
+# The lemmatizer is not needed for entities or noun chunks.
+SPACY_BATCH_SIZE = int(os.environ.get("SPACY_BATCH_SIZE", "64"))
+SPACY_PROCESSES = int(os.environ.get("SPACY_PROCESSES", "1"))
+SPACY_DISABLE = ["lemmatizer"]
+# Concurrent requests share one spaCy pipeline; parses are serialized
+nlp_lock = threading.Lock()
+# Contexts analyzed ahead of generation in one nlp.pipe call
+NLP_LOOKAHEAD_CONTEXTS = int(os.environ.get("NLP_LOOKAHEAD_CONTEXTS", "16"))
 
-def extract_key_answers(context, max_answers=5):
-    doc = nlp(context)
+ANSWER_ENTITY_LABELS = ["PERSON", "GPE", "ORG", "DATE", "CARDINAL", "EVENT"]
+NOUN_CHUNK_LABEL = "NOUN_CHUNK"
+
+# Questions generated for a context are stored by its text, so re-uploading an
+# edited PDF reuses them for every unchanged context (QUIZ_REUSE_QUESTIONS=0
+# always generates fresh ones). Bump the version when generation changes.
+REUSE_QUESTIONS = os.environ.get("QUIZ_REUSE_QUESTIONS", "1") != "0"
+QUESTION_CACHE_VERSION = 5
+
+# Preferred cloze sentence length (words)
+CLOZE_MIN_WORDS = int(os.environ.get("CLOZE_MIN_WORDS", "6"))
+CLOZE_MAX_WORDS = int(os.environ.get("CLOZE_MAX_WORDS", "40"))
+
+# Share of each question type in a quiz, unless a request gives its own mix
+# (see parse_type_mix); types are assigned before generation.
+DEFAULT_TYPE_MIX = os.environ.get("QUIZ_TYPE_MIX", "short:1,cloze:1,mcq:1")
+
+# Distractors are sampled in rounds of k sequences per MCQ prompt (all MCQs of
+# a block in one batched call); a prompt drops out once it has
+# DISTRACTOR_MIN_CANDIDATES distinct candidates. Each quiz may spend at most
+# DISTRACTOR_TOKEN_BUDGET generated tokens / DISTRACTOR_TIME_BUDGET seconds
+# on distractors (0 = no limit); past that, items fall back to the quiz's
+# other answers, and MCQs left without k distractors become short questions.
+DISTRACTOR_MAX_ROUNDS = int(os.environ.get("QUIZ_DISTRACTOR_ROUNDS", "2"))
+DISTRACTOR_MIN_CANDIDATES = int(os.environ.get("QUIZ_DISTRACTOR_MIN_CANDIDATES", "4"))
+DISTRACTOR_TOKEN_BUDGET = int(os.environ.get("QUIZ_DISTRACTOR_TOKEN_BUDGET", "6000"))
+DISTRACTOR_TIME_BUDGET = float(os.environ.get("QUIZ_DISTRACTOR_TIME_BUDGET", "60"))
+DISTRACTOR_MAX_NEW_TOKENS = 80
+DISTRACTOR_MIN_NEW_TOKENS = 16  # rounds capped below this are not worth running
+
+# "retrieval" takes distractors from the document's own entities / noun
+# chunks (same label as the answer, SBERT similarity to it within
+# [DISTRACTOR_SIM_MIN, DISTRACTOR_SIM_MAX], i.e. related but not a paraphrase)
+# and samples the T5 model only for answers without enough of them; "model"
+# always samples. At most DISTRACTOR_POOL_MAX surfaces per label (the most
+# frequent) are compared.
+DISTRACTOR_SOURCE = os.environ.get("QUIZ_DISTRACTOR_SOURCE", "retrieval")
+DISTRACTOR_SIM_MIN = float(os.environ.get("QUIZ_DISTRACTOR_SIM_MIN", "0.3"))
+DISTRACTOR_SIM_MAX = float(os.environ.get("QUIZ_DISTRACTOR_SIM_MAX", "0.85"))
+DISTRACTOR_POOL_MAX = int(os.environ.get("QUIZ_DISTRACTOR_POOL_MAX", "300"))
+
+# Candidate answers are ranked and checked before any question is generated:
+# bad answers (emails, metadata words, stop words only) are dropped, and so
+# are near-duplicates of answers already in the quiz, by content-word
+# overlap (Jaccard >= ANSWER_DUP_JACCARD) or SBERT similarity
+# (>= ANSWER_DUP_SIMILARITY).
+BAD_ANSWER_RE = re.compile(
+    r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}|introduction|author|student|supervisor|email|university"
+)
+ANSWER_DUP_JACCARD = float(os.environ.get("QUIZ_ANSWER_DUP_JACCARD", "0.5"))
+ANSWER_DUP_SIMILARITY = float(os.environ.get("QUIZ_ANSWER_DUP_SIM", "0.85"))
+
+answer_lock = threading.Lock()
+answer_stats = {
+    "candidates": 0,
+    "bad": 0,
+    "duplicate_string": 0,
+    "duplicate_embedding": 0,
+    "generate_calls_avoided": 0,
+    "planned_short": 0,
+    "planned_cloze": 0,
+    "planned_mcq": 0,
+    "cloze_unavailable": 0,
+    "type_unavailable": 0,
+    "qag_calls_avoided": 0,
+}
+
+distractor_lock = threading.Lock()
+distractor_stats = {
+    "retrieved": 0,
+    "model_fallbacks": 0,
+    "prompts": 0,
+    "rounds": 0,
+    "sequences": 0,
+    "tokens": 0,
+    "early_stopped": 0,
+    "budget_exhausted": 0,
+    "answer_fallbacks": 0,
+    "downgraded": 0,
+    "dropped": 0,
+}
+
+
+def document_from_contexts(contexts):
+    """
+    Wrap plain "title\nbody" context strings as a document (the structure
+    extract_text builds), tokenizing each body once.
+    """
+    sentences = []
+    records = []
+    for context in contexts:
+        title, body = context.split("\n", 1) if "\n" in context else ("", context)
+        ids = []
+        for text in sent_tokenize(body):
+            ids.append(len(sentences))
+            sentences.append({
+                "id": len(sentences), "text": text, "page": None,
+                "heading": title, "start": None, "end": None
+            })
+        records.append({
+            "id": len(records), "title": title, "text": context,
+            "sentence_ids": ids, "page_start": None, "page_end": None
+        })
+    return {"sentences": sentences, "contexts": records}
+
+
+def context_views(document):
+    """Context records with their sentence objects resolved (in memory only)."""
+    sentences = document["sentences"]
+    return [
+        {**record, "sentences": [sentences[i] for i in record["sentence_ids"]]}
+        for record in document["contexts"]
+    ]
+
+
+def as_context(context):
+    if isinstance(context, str):
+        return context_views(document_from_contexts([context]))[0]
+    return context
+
+
+def context_sentences(context):
+    """(position in context["sentences"], text) pairs; the heading line has position None."""
+    pairs = [(None, context["title"])] if context.get("title") else []
+    pairs += [(pos, sent["text"]) for pos, sent in enumerate(context["sentences"])]
+    return pairs
+
+
+def analyze_sentences(sentences, spans=None):
+    """
+    Parse sentences missing from `spans` in one nlp.pipe pass and cache their
+    entities and noun chunks with their character offsets:
+    spans[sentence] = {"ents": [(text, label, start, end)], "chunks": [(text, start, end)]}.
+    """
+    spans = {} if spans is None else spans
+    todo = list(dict.fromkeys(s for s in sentences if s and s not in spans))
+
+    with nlp_lock:
+        docs = nlp.pipe(
+            todo,
+            batch_size=SPACY_BATCH_SIZE,
+            n_process=SPACY_PROCESSES,
+            disable=SPACY_DISABLE
+        )
+        for sent, doc in zip(todo, docs):
+            spans[sent] = {
+                "ents": [(ent.text, ent.label_, ent.start_char, ent.end_char) for ent in doc.ents],
+                "chunks": [(chunk.text, chunk.start_char, chunk.end_char) for chunk in doc.noun_chunks]
+            }
+
+    return spans
+
+
+def analyze_contexts(contexts, spans=None):
+    sentences = [text for context in contexts for _, text in context_sentences(context)]
+    return analyze_sentences(sentences, spans)
+
+
+def new_answer_index(document):
+    """
+    Inverted index from answer surface forms to the document's sentences:
+    index["answers"][surface.lower()] = {sentence id: [(start, end), ...]},
+    plus each surface's spaCy label (NOUN_CHUNK_LABEL for noun chunks) and
+    the surfaces per label, for retrieving distractors.
+    Filled by index_answer_spans as sentences are parsed.
+    """
+    return {
+        "sentences": document["sentences"],
+        "answers": {},
+        "surfaces": {},
+        "labels": {},
+        "by_label": {},
+        "indexed": set(),
+        "used": set()
+    }
+
+
+def index_answer_spans(index, contexts, spans):
+    """Add the entity / noun-chunk spans of the contexts' body sentences to the index."""
+    answers = index["answers"]
+    for context in contexts:
+        for sent in context["sentences"]:
+            if sent["id"] in index["indexed"] or sent["text"] not in spans:
+                continue
+            index["indexed"].add(sent["id"])
+
+            info = spans[sent["text"]]
+            found = (
+                [(text, label, start, end) for text, label, start, end in info["ents"]]
+                + [(text, NOUN_CHUNK_LABEL, start, end) for text, start, end in info["chunks"]]
+            )
+            for text, label, start, end in found:
+                key = text.lower()
+                hits = answers.setdefault(key, {}).setdefault(sent["id"], [])
+                if (start, end) not in hits:
+                    hits.append((start, end))
+
+                index["surfaces"].setdefault(key, text)
+                # An entity label wins over the generic noun-chunk one
+                if index["labels"].get(key, NOUN_CHUNK_LABEL) == NOUN_CHUNK_LABEL:
+                    if key in index["labels"]:
+                        index["by_label"][NOUN_CHUNK_LABEL].discard(key)
+                    index["labels"][key] = label
+                    index["by_label"].setdefault(label, set()).add(key)
+
+
+def extract_answer_spans(context, max_answers=5, spans=None):
+    """Candidate answers as (text, position of the sentence they come from)."""
+    sentences = context_sentences(context)
+    spans = analyze_sentences([text for _, text in sentences], spans)
     answers = []
 
-    for ent in doc.ents:
-        if ent.label_ in ["PERSON", "GPE", "ORG", "DATE", "CARDINAL", "EVENT"]:
-            if 1 <= len(ent.text.split()) <= 3:
-                answers.append(ent.text)
+    for pos, sent in sentences:
+        for text, label, _, _ in spans.get(sent, {}).get("ents", []):
+            if label in ANSWER_ENTITY_LABELS:
+                if 1 <= len(text.split()) <= 3:
+                    answers.append((text, pos))
 
     # fallback noun chunks
     if len(answers) < max_answers:
-        for chunk in doc.noun_chunks:
-            if 1 <= len(chunk.text.split()) <= 3:
-                answers.append(chunk.text)
+        for pos, sent in sentences:
+            for text, _, _ in spans.get(sent, {}).get("chunks", []):
+                if 1 <= len(text.split()) <= 3:
+                    answers.append((text, pos))
 
     # unique & ordered
     seen = set()
     final = []
-    for a in answers:
+    for a, pos in answers:
         if a.lower() not in seen:
-            final.append(a)
+            final.append((a, pos))
             seen.add(a.lower())
 
     return final[:max_answers]
 
+
+def extract_key_answers(context, max_answers=5, spans=None):
+    return [a for a, _ in extract_answer_spans(as_context(context), max_answers, spans)]
+
 def is_bad_answer(ans: str) -> bool:
-    ans = ans.lower()
+    ans = ans.lower().strip()
 
-    # Email
-    if re.search(r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}", ans):
+    # Email / metadata words
+    if BAD_ANSWER_RE.search(ans):
         return True
 
-    # Metadata words
-    banned = [
-        "introduction", "author", "student",
-        "supervisor", "email", "university"
-    ]
-    if any(b in ans for b in banned):
+    # Nothing to ask about: punctuation only, or only stop words ("it", "this one")
+    if not re.search(r"\w", ans) or all(word in nlp.Defaults.stop_words for word in ans.split()):
         return True
 
     return False
 
 
+def answer_tokens(ans: str) -> frozenset:
+    """Content words of an answer, for cheap near-duplicate checks."""
+    return frozenset(w for w in re.findall(r"\w+", ans.lower()) if w not in nlp.Defaults.stop_words)
+
+
+def new_answer_registry():
+    """Answers already chosen for a quiz (content words and embeddings)."""
+    return {"tokens": [], "vectors": []}
+
+
+def answer_rejection(ans, vector, registry):
+    """Why an answer should not be generated for ("bad", "duplicate_string", "duplicate_embedding") or None."""
+    if is_bad_answer(ans):
+        return "bad"
+
+    tokens = answer_tokens(ans)
+    for other in registry["tokens"]:
+        if len(tokens & other) >= ANSWER_DUP_JACCARD * len(tokens | other):
+            return "duplicate_string"
+
+    if registry["vectors"]:
+        sims = util.cos_sim(vector, torch.stack(registry["vectors"]))[0]
+        if float(sims.max()) >= ANSWER_DUP_SIMILARITY:
+            return "duplicate_embedding"
+    return None
+
+
+def register_answers(registry, answers, vectors=None):
+    if vectors is None:
+        vectors = embedding_service.encode(list(answers)) if answers else []
+    for ans, vector in zip(answers, vectors):
+        registry["tokens"].append(answer_tokens(ans))
+        registry["vectors"].append(vector)
+
+
+def rank_answers(answers, index=None):
+    """
+    Entities before noun chunks, then answers mentioned in more sentences of
+    the document; the sort is stable, so ties keep the caller's order.
+    """
+    if index is None:
+        return answers
+
+    def score(entry):
+        key = entry[0].lower()
+        is_entity = index["labels"].get(key, NOUN_CHUNK_LABEL) != NOUN_CHUNK_LABEL
+        return (is_entity, len(index["answers"].get(key, ())))
+
+    return sorted(answers, key=score, reverse=True)
+
+
+def count_answers(**counts):
+    with answer_lock:
+        for name, value in counts.items():
+            answer_stats[name] += value
+
+
+def run_qag_batch(prompts):
+    inputs = pad_batch(qag_tokenizer, prompts).to(qag_model.device)
+
+    with torch.no_grad():
+        outputs = qag_model.generate(**inputs, **QAG_GENERATE_KWARGS)
+
+    return [qag_tokenizer.decode(output, skip_special_tokens=True).strip() for output in outputs]
+
+
+def run_distractor_batch(prompts, n, max_new_tokens=80):
+    """
+    n sampled sequences per prompt -> (decoded texts, generated tokens,
+    seconds) per prompt; seconds is the prompt's share of the generate call.
+    """
+    start = time.perf_counter()
+    inputs = pad_batch(dist_tokenizer, prompts).to(dist_model.device)
+
+    with torch.no_grad():
+        outputs = dist_model.generate(
+            **inputs,
+            num_return_sequences=n,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            top_p=0.9
+        )
+
+    # ✅ Decode FIRST; sequences for one prompt are consecutive
+    decoded = [
+        dist_tokenizer.decode(o, skip_special_tokens=True).strip()
+        for o in outputs
+    ]
+    tokens = (outputs != dist_tokenizer.pad_token_id).sum(dim=1).tolist()
+    share = (time.perf_counter() - start) / len(prompts)
+    return [
+        (decoded[i:i + n], sum(tokens[i:i + n]), share)
+        for i in range(0, len(decoded), n)
+    ]
+
+
+def run_generation_batch(prompts, key):
+    if key[0] == "qag":
+        return run_qag_batch(prompts)
+    return run_distractor_batch(prompts, key[1], key[2])
+
+
+# Every T5 generate() call goes through one scheduler: prompts (token id
+# lists, see prompt_tokens.py) from concurrent requests are coalesced within
+# QUIZ_BATCH_MAX_WAIT_MS and run in batches of similar token length
+# (see batching.py)
+generation_batcher = MicroBatcher(run_generation_batch, max_batch=QAG_BATCH_SIZE)
+
+
+def generate_questions_batch(pairs):
+    """
+    Generate one question per (context, answer) pair.
+    Prompts are batched with those of other requests by length and run
+    through qag_model.generate; results come back in input order.
+    """
+    prompts = [
+        assemble(qag_tokenizer, qag_prompt_segments(context, answer))
+        for context, answer in pairs
+    ]
+    return generation_batcher.submit_many(prompts, key=("qag",))
+
+
+def generate_question(context, answer):
+    return generate_questions_batch([(context, answer)])[0]
+
+
 QUESTION_TYPES = ["short", "cloze", "mcq"]
 
-def generate_questions_from_context(
+
+def parse_type_mix(mix=None):
+    """
+    Requested share of each question type, as {"mcq": 0.6, "cloze": 0.2,
+    "short": 0.2} or "mcq:60,cloze:20,short:20" -> shares summing to 1.
+    """
+    mix = DEFAULT_TYPE_MIX if mix is None else mix
+    if isinstance(mix, str):
+        mix = {
+            name.strip(): float(weight)
+            for name, weight in (part.split(":", 1) for part in mix.split(",") if part.strip())
+        }
+
+    unknown = set(mix) - set(QUESTION_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown question types {sorted(unknown)}, expected {QUESTION_TYPES}")
+    weights = {qtype: max(0.0, float(mix.get(qtype, 0))) for qtype in QUESTION_TYPES}
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("The question type mix needs at least one positive weight")
+    return {qtype: weight / total for qtype, weight in weights.items()}
+
+
+def new_type_plan(mix=None):
+    """Type quotas for one quiz: the mix and how many items of each type exist."""
+    return {"mix": parse_type_mix(mix), "counts": dict.fromkeys(QUESTION_TYPES, 0)}
+
+
+def type_preferences(plan):
+    """Types ordered by how far each is behind its share of the quiz (most behind first)."""
+    n = sum(plan["counts"].values()) + 1
+    types = [qtype for qtype in QUESTION_TYPES if plan["mix"][qtype] > 0]
+    return sorted(types, key=lambda qtype: plan["mix"][qtype] * n - plan["counts"][qtype], reverse=True)
+
+
+def assign_type(plan, context, answer, position, index=None):
+    """
+    (type, question) for a new item. A cloze is made right away from the
+    text (no model call); when the answer has no usable sentence the next
+    type behind its quota is used instead. (None, None) when no type the mix
+    allows fits the answer.
+    """
+    qtype, question = None, None
+    for preferred in type_preferences(plan):
+        if preferred != "cloze":
+            qtype = preferred
+            break
+        cloze = generate_cloze(context, answer, position, index=index)
+        if cloze:
+            qtype, question = "cloze", cloze
+            break
+        count_answers(cloze_unavailable=1)
+
+    if qtype is None:
+        count_answers(type_unavailable=1)
+        return None, None
+    plan["counts"][qtype] += 1
+    count_answers(**{f"planned_{qtype}": 1})
+    if question is not None:
+        count_answers(qag_calls_avoided=1)
+    return qtype, question
+
+def plan_questions_from_context(
     context,
-    max_questions_per_context=2
+    max_questions_per_context=2,
+    timings=None,
+    spans=None,
+    index=None,
+    registry=None,
+    type_plan=None
 ):
-    questions = []
-    answers = extract_key_answers(context, max_answers=5)
+    """
+    Pick answers and question types for a context; cloze questions are made
+    here and the others are filled in later. Candidates are ranked (see
+    rank_answers) and checked against the quiz's `registry` so bad and
+    near-duplicate answers never reach the QAG model; types follow the
+    quiz's `type_plan` (new_type_plan). Items keep their context view and
+    answer sentence until completed.
+    """
+    context = as_context(context)
+    items = []
+    with timed(timings, "answer_extraction"):
+        answers = extract_answer_spans(context, max_answers=5, spans=spans)
     random.shuffle(answers)
+    answers = rank_answers(answers, index)
 
-    used_answers = set()
+    # `local` checks the context on its own; the answers it keeps are what
+    # the question cache may store, and items are only marked cacheable when
+    # the quiz-wide `registry` did not change that choice
+    local = new_answer_registry()
+    shared = registry is not None
+    registry = registry if shared else local
+    type_plan = new_type_plan() if type_plan is None else type_plan
+    vectors = embedding_service.encode([ans for ans, _ in answers]) if answers else []
+    count_answers(candidates=len(answers))
+    own_choice = []
 
-    for ans in answers:
-        if len(questions) >= max_questions_per_context:
+    for (ans, pos), vector in zip(answers, vectors):
+        if len(items) >= max_questions_per_context and len(own_choice) >= max_questions_per_context:
             break
-        if ans.lower() in used_answers:
+        reason = answer_rejection(ans, vector, local)
+        if reason is None:
+            if len(own_choice) < max_questions_per_context:
+                own_choice.append(ans)
+            if shared:
+                reason = answer_rejection(ans, vector, registry)
+            register_answers(local, [ans], [vector])
+
+        if len(items) >= max_questions_per_context:
+            continue
+        if reason:
+            # The old planner would have generated a question for it
+            count_answers(**{reason: 1, "generate_calls_avoided": 1})
             continue
 
-        q_type = random.choice(QUESTION_TYPES)
-        base_question = generate_question(context, ans)
+        qtype, question = assign_type(type_plan, context, ans, pos, index=index)
+        if qtype is None:
+            continue
+        items.append({
+            "context": context["text"],
+            "type": qtype,
+            "question": question,
+            "answer": ans,
+            "_context": context,
+            "_sentence": pos
+        })
+        if shared:
+            register_answers(registry, [ans], [vector])
 
-        item = {
-            "context": context,
-            "type": q_type,
-            "question": base_question,
-            "answer": ans
-        }
+    cacheable = [item["answer"] for item in items] == own_choice
+    for item in items:
+        item["_cacheable"] = cacheable
+
+    return items
+
+
+def question_cache_key(context_text, max_questions_per_context, mix=None):
+    # Item types follow the quiz's type mix, so groups are kept per mix
+    mix = sorted((qtype, round(share, 6)) for qtype, share in parse_type_mix(mix).items())
+    return make_key(
+        QUESTION_CACHE_VERSION, context_text, max_questions_per_context, mix,
+        QAG_MODEL_PATH, DIST_MODEL_PATH, T5_BACKEND, DISTRACTOR_MODEL_MODE, QAG_GENERATE_KWARGS
+    )
+
+
+def store_questions(items, max_questions_per_context, mix=None):
+    """Cache completed items per context for later quizzes on the same text."""
+    by_context = {}
+    for item in items:
+        by_context.setdefault(item["context"], []).append(item)
 
-        # Cloze handling
-        if q_type == "cloze":
-            cloze = generate_cloze(context, ans)
-            if cloze:
-                item["question"] = cloze
-            else:
+    for text, group in by_context.items():
+        cache_put("questions", question_cache_key(text, max_questions_per_context, mix), group, evict=False)
+    if by_context:
+        evict_lru(CACHE_MAX_BYTES)
+
+
+def complete_questions(items, timings=None, budget=None, type_plan=None):
+    """
+    Run batched question generation for planned items still without a
+    question, then MCQ handling. `budget` (new_distractor_budget) is shared by the blocks of one quiz;
+    MCQs downgraded to short questions are moved in its `type_plan` counts, or
+    dropped when its mix excludes short questions. Returns the kept items.
+    """
+    # Only short and MCQ items need the QAG model; clozes were made when planned
+    need = [item for item in items if item["question"] is None]
+    with timed(timings, "question_generation"):
+        base_questions = generate_questions_batch(
+            [(item["context"], item["answer"]) for item in need]
+        )
+
+    for item, base_question in zip(need, base_questions):
+        item["question"] = base_question
+
+    # MCQ handling: sample candidates per item, embed all of them (and the
+    # MMR queries) in one SBERT call, then select with cache hits only
+    if budget is None:
+        budget = new_distractor_budget()
+    mcq_items = [item for item in items if item["type"] == "mcq"]
+    with timed(timings, "distractors"):
+        candidates = [[] for _ in mcq_items]
+        if DISTRACTOR_SOURCE == "retrieval":
+            by_index = {}
+            for i, item in enumerate(mcq_items):
+                if item.get("_index") is not None:
+                    by_index.setdefault(id(item["_index"]), []).append(i)
+            for positions in by_index.values():
+                index = mcq_items[positions[0]]["_index"]
+                retrieved = retrieve_distractor_candidates(index, [mcq_items[i]["answer"] for i in positions])
+                for i, group in zip(positions, retrieved):
+                    candidates[i] = group
+
+        # The T5 sampler only runs for answers retrieval could not serve
+        need = [i for i, group in enumerate(candidates) if len(group) < 3]
+        count_distractors(retrieved=len(mcq_items) - len(need), model_fallbacks=len(need))
+        sampled = sample_distractor_candidates_batch(
+            [(mcq_items[i]["context"], mcq_items[i]["question"], mcq_items[i]["answer"]) for i in need],
+            k=3,
+            budget=budget
+        )
+        for i, group in zip(need, sampled):
+            candidates[i] = candidates[i] + [d for d in group if d not in candidates[i]]
+        budget["answers"].extend(item["answer"] for item in items)
+        candidates = [
+            with_answer_fallback(group, item["answer"], budget["answers"], k=3)
+            for item, group in zip(mcq_items, candidates)
+        ]
+
+    with timed(timings, "mmr"):
+        queries = [item["question"] + " " + item["answer"] for item in mcq_items]
+        all_texts = [c for group in candidates for c in group] + queries
+        if all_texts:
+            embedding_service.encode(all_texts)
+
+        dropped = set()
+        for item, group, query in zip(mcq_items, candidates, queries):
+            if len(group) < 3:
+                # Not enough distractors for a fair MCQ
+                if type_plan is not None:
+                    type_plan["counts"]["mcq"] -= 1
+                    if type_plan["mix"]["short"] <= 0:
+                        dropped.add(id(item))
+                        count_distractors(dropped=1)
+                        continue
+                    type_plan["counts"]["short"] += 1
                 item["type"] = "short"
+                count_distractors(downgraded=1)
+                continue
+            item["distractors"] = mmr_select(group, query, k=3)
+
+    for item in items:
+        item.pop("_context", None)
+        item.pop("_sentence", None)
+        item.pop("_index", None)
+        item.pop("_cacheable", None)
+
+    return [item for item in items if id(item) not in dropped]
+
+
+def generate_questions_from_context(
+    context,
+    max_questions_per_context=2
+):
+    return complete_questions(
+        plan_questions_from_context(context, max_questions_per_context)
+    )
+
+
+def iter_quiz_from_document(
+    document,
+    total_questions=20,
+    max_questions_per_context=2,
+    context_window=QAG_CONTEXT_WINDOW,
+    timings=None,
+    reuse_questions=REUSE_QUESTIONS,
+    type_mix=None
+):
+    """
+    Yield quiz items as soon as they are generated. Questions for
+    `context_window` contexts are planned together and generated in one
+    batched pass; generation stops once `total_questions` items exist.
+    Types follow `type_mix` (see parse_type_mix) across the whole quiz.
+    With reuse_questions, contexts that already have stored questions skip
+    analysis and generation. Stage durations are added to `timings` when a
+    dict is given.
+    """
+    contexts = context_views(document)
+    produced = 0
+    pending = []
+    spans = {}
+    index = new_answer_index(document)
+    analyzed = 0
+    reused = {}
+
+    budget = new_distractor_budget()
+    registry = new_answer_registry()
+    type_plan = new_type_plan(type_mix)
+
+    def finish(items, dropped=()):
+        """Complete the items this quiz keeps; `dropped` were cut by the quota."""
+        fresh = [item for item in items if "_context" in item]
+        budget["answers"].extend(item["answer"] for item in items if "_context" not in item)
+        # Only store a context's group when it is what the context yields on
+        # its own: not cut by the quota, not filtered by this quiz's answers
+        partial = {item["context"] for item in dropped}
+        partial.update(item["context"] for item in fresh if not item.get("_cacheable"))
+        kept = {id(item) for item in complete_questions(fresh, timings, budget, type_plan)}
+        removed = {id(item) for item in fresh} - kept
+        # MCQs the mix could not downgrade were dropped, their groups are partial too
+        partial.update(item["context"] for item in fresh if id(item) in removed)
+        if reuse_questions:
+            store_questions(
+                [item for item in fresh if item["context"] not in partial],
+                max_questions_per_context,
+                type_plan["mix"]
+            )
+        return [item for item in items if id(item) not in removed]
+
+    for ctx_idx, context in enumerate(contexts):
+        if produced + len(pending) >= total_questions:
+            break
+
+        # spaCy runs over the next block of contexts at once; sentences shared
+        # by overlapping windows are parsed only the first time
+        if ctx_idx >= analyzed:
+            analyzed = ctx_idx + max(context_window, NLP_LOOKAHEAD_CONTEXTS)
+            block = range(ctx_idx, min(analyzed, len(contexts)))
+            if reuse_questions:
+                for i in block:
+                    cached = cache_get(
+                        "questions",
+                        question_cache_key(contexts[i]["text"], max_questions_per_context, type_plan["mix"])
+                    )
+                    if cached is not None:
+                        reused[i] = cached
+            fresh = [contexts[i] for i in block if i not in reused]
+            with timed(timings, "answer_extraction"):
+                analyze_contexts(fresh, spans)
+                index_answer_spans(index, fresh, spans)
 
-        # MCQ handling
-        if item["type"] == "mcq":
-            item["distractors"] = generate_distractors(
+        if ctx_idx in reused:
+            stored = [dict(item) for item in reused.pop(ctx_idx)]
+            vectors = embedding_service.encode([item["answer"] for item in stored]) if stored else []
+            for item, vector in zip(stored, vectors):
+                # Stored answers go through the same quiz-wide checks as fresh ones
+                reason = answer_rejection(item["answer"], vector, registry)
+                if reason:
+                    count_answers(**{reason: 1})
+                    continue
+                register_answers(registry, [item["answer"]], [vector])
+                type_plan["counts"][item["type"]] += 1
+                pending.append(item)
+        else:
+            planned = plan_questions_from_context(
                 context,
-                item["question"],
-                ans,
-                k=3
+                max_questions_per_context=max_questions_per_context,
+                timings=timings,
+                spans=spans,
+                index=index,
+                registry=registry,
+                type_plan=type_plan
             )
+            for item in planned:
+                item["_index"] = index
+            pending.extend(planned)
+
+        if (ctx_idx + 1) % context_window == 0:
+            quota = total_questions - produced
+            for item in finish(pending[:quota], pending[quota:]):
+                produced += 1
+                yield item
+            pending = []
+
+    if pending:
+        quota = total_questions - produced
+        yield from finish(pending[:quota], pending[quota:])
+
+
+def iter_quiz_from_contexts(
+    contexts,
+    total_questions=20,
+    max_questions_per_context=2,
+    context_window=QAG_CONTEXT_WINDOW,
+    timings=None
+):
+    yield from iter_quiz_from_document(
+        document_from_contexts(contexts),
+        total_questions=total_questions,
+        max_questions_per_context=max_questions_per_context,
+        context_window=context_window,
+        timings=timings
+    )
 
-        questions.append(item)
-        used_answers.add(ans.lower())
 
-    return questions
+def generate_quiz_from_contexts(
+    contexts,
+    total_questions=20,
+    max_questions_per_context=2,
+    context_window=QAG_CONTEXT_WINDOW,
+    timings=None
+):
+    return list(iter_quiz_from_contexts(
+        contexts,
+        total_questions=total_questions,
+        max_questions_per_context=max_questions_per_context,
+        context_window=context_window,
+        timings=timings
+    ))
 
 
 
@@ -150,17 +851,81 @@ def generate_questions_from_context(
 #            )
 #    return None
 
-def generate_cloze(context, answer):
+def blank_spans(text, offsets, answer=None):
+    """
+    Blank the indexed answer spans, then any other case-insensitive
+    occurrence of `answer` spaCy did not tag (it would give the answer away).
+    """
+    for start, end in sorted(offsets, reverse=True):
+        text = text[:start] + "____" + text[end:]
+    if answer:
+        text = re.sub(re.escape(answer), "____", text, flags=re.IGNORECASE)
+    return text
+
+
+def pick_cloze_sentence(index, answer, source_id=None):
+    """
+    Best indexed sentence for the answer anywhere in the document: not yet
+    used by another cloze, of a readable length, preferably the sentence the
+    answer was extracted from. Returns (sentence, offsets) or None.
+    """
+    hits = index["answers"].get(answer.lower())
+    if not hits:
+        return None
+
+    def rank(sid):
+        words = len(index["sentences"][sid]["text"].split())
+        return (
+            sid in index["used"],
+            not CLOZE_MIN_WORDS <= words <= CLOZE_MAX_WORDS,
+            sid != source_id,
+            sid
+        )
+
+    for sid in sorted(hits, key=rank):
+        sent = index["sentences"][sid]
+        # Avoid title/introduction sentences
+        if "introduction" in sent["text"].lower():
+            continue
+        index["used"].add(sid)
+        return sent, hits[sid]
+    return None
+
+
+def generate_cloze(context, answer, position=None, index=None):
+    """
+    Blank the answer in a sentence of the (already tokenized) context. With an
+    answer index the sentence is looked up across the document and blanked by
+    offset; otherwise the sentence the answer was extracted from (`position`)
+    is tried first.
+    """
     # Reject email or long answers
     if len(answer.split()) > 3:
         return None
     if re.search(r"@", answer):
         return None
 
-    for sent in sent_tokenize(context):
-        if answer.lower() in sent.lower():
+    context = as_context(context)
+    if index is not None:
+        source_id = context["sentences"][position]["id"] if position is not None else None
+        picked = pick_cloze_sentence(index, answer, source_id)
+        if picked:
+            sent, offsets = picked
+            return blank_spans(sent["text"], offsets, answer)
+
+    sentences = [sent["text"] for sent in context["sentences"]]
+    order = list(range(len(sentences)))
+    if position is not None and 0 <= position < len(sentences):
+        order.remove(position)
+        order.insert(0, position)
+
+    answer_lower = answer.lower()
+    for i in order:
+        sent = sentences[i]
+        sent_lower = sent.lower()
+        if answer_lower in sent_lower:
             # Avoid title/introduction sentences
-            if "introduction" in sent.lower():
+            if "introduction" in sent_lower:
                 continue
 
             return re.sub(
@@ -176,8 +941,9 @@ def mmr_select(candidates, query, k=3, lam=0.7):
     if len(candidates) <= k:
         return candidates
 
-    q_emb = sbert.encode(query, convert_to_tensor=True)
-    c_emb = sbert.encode(candidates, convert_to_tensor=True)
+    # Cached: complete_questions embeds every candidate of the quiz up front
+    q_emb = embedding_service.encode(query)
+    c_emb = embedding_service.encode(candidates)
 
     selected = []
     idxs = list(range(len(candidates)))
@@ -197,78 +963,270 @@ def mmr_select(candidates, query, k=3, lam=0.7):
     return [candidates[i] for i in selected]
 
 
-def generate_distractors(context, question, answer, k=3):
-    prompt = f"""
-Generate plausible but incorrect distractors.
-Question: {question}
-Correct answer: {answer}
-Context: {context}
-Distractors:
-"""
-
-    inputs = dist_tokenizer(
-        prompt,
-        return_tensors="pt",
-        truncation=True,
-        max_length=512
-    ).to(device)
+def label_pool(index, label):
+    """The DISTRACTOR_POOL_MAX most frequent indexed surfaces with this label."""
+    keys = index["by_label"].get(label, ())
+    if len(keys) <= DISTRACTOR_POOL_MAX:
+        return list(keys)
+    return sorted(keys, key=lambda key: len(index["answers"][key]), reverse=True)[:DISTRACTOR_POOL_MAX]
 
-    with torch.no_grad():
-        outputs = dist_model.generate(
-            **inputs,
-            num_return_sequences=k*2,
-            max_new_tokens=80,
-            do_sample=True,
-            top_p=0.9
+
+def retrieve_distractor_candidates(index, answers, limit=None):
+    """
+    Distractor candidates for each answer from the document's answer index:
+    surfaces with the answer's label whose similarity to it falls in the
+    band, most similar first. All strings are embedded in one cached call.
+    """
+    limit = limit or max(3, DISTRACTOR_MIN_CANDIDATES) * 2
+    pools = {}
+    per_answer = []
+    for answer in answers:
+        low = answer.lower()
+        label = index["labels"].get(low, NOUN_CHUNK_LABEL)
+        if label not in pools:
+            pools[label] = [
+                key for key in label_pool(index, label)
+                if len(key) > 1 and key not in nlp.Defaults.stop_words and len(key.split()) <= 4
+            ]
+        per_answer.append([
+            index["surfaces"][key] for key in pools[label]
+            if key != low and key not in low and low not in key
+        ])
+
+    texts = list(dict.fromkeys(list(answers) + [text for pool in per_answer for text in pool]))
+    if len(texts) == len(set(answers)):
+        return [[] for _ in answers]
+    vectors = embedding_service.encode(texts)
+    row = {text: i for i, text in enumerate(texts)}
+
+    results = []
+    for answer, pool in zip(answers, per_answer):
+        if not pool:
+            results.append([])
+            continue
+        sims = util.cos_sim(vectors[row[answer]], vectors[[row[text] for text in pool]])[0].tolist()
+        ranked = sorted(
+            ((sim, text) for sim, text in zip(sims, pool) if DISTRACTOR_SIM_MIN <= sim <= DISTRACTOR_SIM_MAX),
+            reverse=True
         )
+        results.append([text for _, text in ranked[:limit]])
+    return results
 
-    # ✅ Decode FIRST
-    decoded = [
-        dist_tokenizer.decode(o, skip_special_tokens=True).strip()
-        for o in outputs
-    ]
 
-    # ✅ Filter AFTER decoding
-    candidates = list(set(
-        d for d in decoded
-        if d and answer.lower() not in d.lower()
-    ))
+def new_distractor_budget():
+    """Per-quiz distractor budget; "answers" collects the quiz's answers for fallbacks."""
+    return {"tokens": 0, "seconds": 0.0, "answers": []}
+
+
+def round_token_cap(budget, sequences):
+    """
+    max_new_tokens for a round of `sequences` sampled sequences that keeps
+    the budget from being overrun (0 once it is spent). The time budget is
+    turned into tokens with the quiz's measured seconds per token so far.
+    """
+    allowed = None
+    if DISTRACTOR_TOKEN_BUDGET > 0:
+        allowed = DISTRACTOR_TOKEN_BUDGET - budget["tokens"]
+    if DISTRACTOR_TIME_BUDGET > 0:
+        seconds_left = DISTRACTOR_TIME_BUDGET - budget["seconds"]
+        if seconds_left <= 0:
+            return 0
+        if budget["tokens"] and budget["seconds"] > 0:
+            by_time = int(seconds_left * budget["tokens"] / budget["seconds"])
+            allowed = by_time if allowed is None else min(allowed, by_time)
+
+    cap = DISTRACTOR_MAX_NEW_TOKENS
+    if allowed is not None:
+        cap = min(cap, allowed // max(1, sequences))
+    # Few distinct caps, so rounds of concurrent quizzes still share batches
+    cap = cap // DISTRACTOR_MIN_NEW_TOKENS * DISTRACTOR_MIN_NEW_TOKENS
+    return cap if cap >= DISTRACTOR_MIN_NEW_TOKENS else 0
+
+
+def count_distractors(**counts):
+    with distractor_lock:
+        for name, value in counts.items():
+            distractor_stats[name] += value
+
+
+def sample_distractor_candidates_batch(triples, k=3, budget=None):
+    """
+    Distinct candidates (not containing the answer) for each (context,
+    question, answer). All prompts are sampled together, k sequences per
+    round; prompts with enough candidates stop early, and each round's
+    max_new_tokens is capped so it fits in what is left of the budget.
+    """
+    if budget is None:
+        budget = new_distractor_budget()
+    prompts = [assemble(dist_tokenizer, distractor_prompt_segments(c, q, a)) for c, q, a in triples]
+    candidates = [[] for _ in triples]
+    target = max(k, DISTRACTOR_MIN_CANDIDATES)
+    active = list(range(len(triples)))
+    count_distractors(prompts=len(triples))
+
+    for round_idx in range(DISTRACTOR_MAX_ROUNDS):
+        if not active:
+            break
+        max_new_tokens = round_token_cap(budget, len(active) * k)
+        if not max_new_tokens:
+            count_distractors(budget_exhausted=len(active))
+            break
+
+        # Seconds come from the generate call itself, not the batcher queue
+        results = generation_batcher.submit_many(
+            [prompts[i] for i in active], key=("distractors", k, max_new_tokens)
+        )
+
+        for i, (decoded, tokens, seconds) in zip(active, results):
+            budget["tokens"] += tokens
+            budget["seconds"] += seconds
+            count_distractors(sequences=len(decoded), tokens=tokens)
+            # ✅ Filter AFTER decoding
+            answer = triples[i][2].lower()
+            for d in decoded:
+                if d and answer not in d.lower() and d not in candidates[i]:
+                    candidates[i].append(d)
+        count_distractors(rounds=1)
+
+        remaining = [i for i in active if len(candidates[i]) < target]
+        if round_idx < DISTRACTOR_MAX_ROUNDS - 1:
+            count_distractors(early_stopped=len(active) - len(remaining))
+        active = remaining
+
+    return candidates
+
+
+def with_answer_fallback(candidates, answer, quiz_answers, k=3):
+    """Top up candidates with other answers of the same quiz (MMR then picks among them)."""
+    if len(candidates) >= k:
+        return candidates
+
+    seen = {c.lower() for c in candidates}
+    extra = []
+    for other in quiz_answers:
+        low = other.lower()
+        if low in seen or answer.lower() in low or low in answer.lower():
+            continue
+        seen.add(low)
+        extra.append(other)
+
+    if extra:
+        count_distractors(answer_fallbacks=1)
+    return candidates + extra
+
+
+def sample_distractor_candidates(context, question, answer, k=3):
+    return sample_distractor_candidates_batch([(context, question, answer)], k)[0]
+
+
+def generate_distractors(context, question, answer, k=3):
+    candidates = sample_distractor_candidates(context, question, answer, k)
 
     # MMR selection
     return mmr_select(candidates, question + " " + answer, k)
 
 
 
-def generate_quiz_from_pdf(
+def select_document(document, section=None, sample=None, diverse=False):
+    """
+    Narrow a stored document to one section and/or a sample of its contexts
+    (see context_store.select_contexts); sentences stay whole since their ids
+    index the list.
+    """
+    if not section and sample is None:
+        return document
+    contexts = context_store.select_contexts(document["id"], section=section, sample=sample, diverse=diverse)
+    print(f"Selected {len(contexts)} of {len(document['contexts'])} contexts")
+    return {**document, "contexts": contexts}
+
+
+def iter_quiz_from_pdf(
     pdf_path,
     total_questions=20,
-    max_words_per_context=200
+    max_words_per_context=200,
+    context_window=1,
+    section=None,
+    sample=None,
+    diverse=False,
+    type_mix=None
 ):
-    # 1. PDF → contexts
-    contexts = process_pdf_to_contexts(
+    """
+    Streaming variant of generate_quiz_from_pdf: yields each question item as
+    soon as its context is done (context_window=1 keeps time-to-first-question
+    at a single context's generation cost). section / sample / diverse pick
+    which stored contexts the quiz is drawn from.
+    """
+    # 1. PDF → sentences + contexts
+    document = process_pdf_to_document(
         pdf_path,
         max_words=max_words_per_context
     )
 
-    print(f"Extracted {len(contexts)} contexts")
+    print(f"Extracted {len(document['contexts'])} contexts")
+    document = select_document(document, section=section, sample=sample, diverse=diverse)
 
-    quiz = []
-    ctx_idx = 0
+    # 2. Contexts -> questions
+    yield from iter_quiz_from_document(
+        document,
+        total_questions=total_questions,
+        context_window=context_window,
+        type_mix=type_mix
+    )
 
-    # 2. Loop through contexts
-    while len(quiz) < total_questions and ctx_idx < len(contexts):
-        context = contexts[ctx_idx]
 
-        qa_items = generate_questions_from_context(
-            context,
-            max_questions_per_context=2
-        )
+def generate_quiz_from_pdf(
+    pdf_path,
+    total_questions=20,
+    max_words_per_context=200,
+    section=None,
+    sample=None,
+    diverse=False,
+    type_mix=None
+):
+    return list(iter_quiz_from_pdf(
+        pdf_path,
+        total_questions=total_questions,
+        max_words_per_context=max_words_per_context,
+        context_window=QAG_CONTEXT_WINDOW,
+        section=section,
+        sample=sample,
+        diverse=diverse,
+        type_mix=type_mix
+    ))
+
+
+def to_backend_item(item):
+    """Shape a quiz item the way the Node backend / frontend expect (choices for MCQ)."""
+    out = {
+        "type": item["type"],
+        "question": item["question"],
+        "answer": item["answer"]
+    }
+    if item["type"] == "mcq":
+        choices = [item["answer"]] + list(item.get("distractors", []))
+        random.shuffle(choices)
+        out["choices"] = choices
+    return out
+
+
+def iter_questions(text, top_n=4, context_window=1, type_mix=None):
+    """Streaming variant of generate_questions, yielding backend-shaped items."""
+    document = process_text_to_document(text)
+    if not document["contexts"]:
+        document = document_from_contexts([text])
 
-        for item in qa_items:
-            if len(quiz) >= total_questions:
-                break
-            quiz.append(item)
+    for item in iter_quiz_from_document(
+        document,
+        total_questions=top_n,
+        context_window=context_window,
+        type_mix=type_mix
+    ):
+        yield to_backend_item(item)
 
-        ctx_idx += 1
 
-    return quiz
+def generate_questions(text, top_n=4, type_mix=None):
+    """
+    Entry point used by the Node backend: raw text -> list of quiz items.
+    type_mix (e.g. "mcq:60,cloze:20,short:20") defaults to QUIZ_TYPE_MIX.
+    """
+    return list(iter_questions(text, top_n=top_n, context_window=QAG_CONTEXT_WINDOW, type_mix=type_mix))
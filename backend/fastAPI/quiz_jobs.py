@@ -0,0 +1,155 @@
+"""
+In-process job queue for the quiz worker.
+
+Jobs run on a bounded thread pool and at most JOB_QUEUE_MAX of them wait at
+a time, so concurrent uploads are scheduled instead of each starting its own
+generation. A job records its progress (pages extracted, contexts built,
+questions generated), can be cancelled between steps and keeps its result
+for JOB_TTL_SECONDS after it finishes.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = int(os.environ.get("QUIZ_JOB_WORKERS", "2"))
+JOB_QUEUE_MAX = int(os.environ.get("QUIZ_JOB_QUEUE_MAX", "16"))
+JOB_TTL_SECONDS = int(os.environ.get("QUIZ_JOB_TTL_SECONDS", "3600"))
+
+FINISHED = ("done", "failed", "cancelled")
+
+jobs = {}
+changed = threading.Condition()
+executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="quiz-job")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+def snapshot(job):
+    """Public view of a job (everything but the result and cancel flag)."""
+    return {k: v for k, v in job.items() if k not in ("result", "cancel")}
+
+
+def purge_expired():
+    now = time.time()
+    for job_id in [
+        job_id for job_id, job in jobs.items()
+        if job["status"] in FINISHED and now - job["finished_at"] > JOB_TTL_SECONDS
+    ]:
+        del jobs[job_id]
+
+
+def submit_job(kind, run, params=None):
+    """
+    Queue run(job); its return value becomes the job result. run reports
+    progress with update(job, ...) and stops early when check_cancelled raises.
+    """
+    with changed:
+        purge_expired()
+        queued = sum(1 for job in jobs.values() if job["status"] == "queued")
+        if queued >= JOB_QUEUE_MAX:
+            raise QueueFull(f"{queued} jobs are already queued")
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": params or {},
+            "status": "queued",
+            "progress": {},
+            "version": 0,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "cancel": threading.Event(),
+        }
+        jobs[job["id"]] = job
+
+    executor.submit(run_job, job, run)
+    return snapshot(job)
+
+
+def set_fields(job, **fields):
+    with changed:
+        job.update(fields)
+        job["version"] += 1
+        changed.notify_all()
+
+
+def run_job(job, run):
+    if job["cancel"].is_set():
+        return
+    set_fields(job, status="running", started_at=time.time())
+
+    try:
+        result = run(job)
+    except JobCancelled:
+        set_fields(job, status="cancelled", finished_at=time.time())
+        return
+    except Exception as e:
+        print(f"Job {job['id']} failed: {e}", flush=True)
+        set_fields(job, status="failed", error=str(e), finished_at=time.time())
+        return
+
+    set_fields(job, status="done", result=result, finished_at=time.time())
+
+
+def check_cancelled(job):
+    if job["cancel"].is_set():
+        raise JobCancelled()
+
+
+def update(job, **progress):
+    """Merge progress counters into the job; raises JobCancelled if it was cancelled."""
+    check_cancelled(job)
+    with changed:
+        job["progress"].update(progress)
+        job["version"] += 1
+        changed.notify_all()
+
+
+def get_job(job_id):
+    with changed:
+        job = jobs.get(job_id)
+        return snapshot(job) if job else None
+
+
+def get_result(job_id):
+    """(status, result) or None for unknown jobs."""
+    with changed:
+        job = jobs.get(job_id)
+        return (job["status"], job["result"]) if job else None
+
+
+def cancel_job(job_id):
+    with changed:
+        job = jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] not in FINISHED:
+            job["cancel"].set()
+            if job["status"] == "queued":
+                # Never started: run_job will skip it
+                job.update(status="cancelled", finished_at=time.time())
+            job["version"] += 1
+            changed.notify_all()
+        return snapshot(job)
+
+
+def wait_for_change(job_id, version, timeout=15.0):
+    """Block until the job's version moves past `version` (or timeout); return its snapshot."""
+    with changed:
+        changed.wait_for(
+            lambda: job_id not in jobs or jobs[job_id]["version"] != version,
+            timeout=timeout
+        )
+        job = jobs.get(job_id)
+        return snapshot(job) if job else None
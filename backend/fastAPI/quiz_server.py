@@ -0,0 +1,427 @@
+"""
+Long-lived quiz worker.
+
+Loads quiz_api (QAG + distractor T5 models, spaCy, SBERT) once and serves
+quiz / extraction jobs over local HTTP, so each request only pays the
+warm inference cost instead of re-importing every model.
+
+Long jobs can also be submitted to a bounded queue (quiz_jobs.py) and
+followed by polling /jobs/{id} or subscribing to /jobs/{id}/events (SSE).
+
+Run from backend/fastAPI:
+    uvicorn quiz_server:app --host 127.0.0.1 --port 8001
+"""
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Union
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+import batching
+import context_store
+import prompt_tokens
+import quiz_jobs
+
+quiz_api = None
+
+state = {
+    "ready": False,
+    "error": None,
+    "started_at": time.time(),
+    "cold_start_seconds": None,
+    "warm_requests": 0,
+    "warm_total_seconds": 0.0,
+    "warm_last_seconds": None,
+}
+
+# Requests generating at the same time. With batching on, their model calls
+# are coalesced by quiz_api.generation_batcher, which alone drives the models;
+# without it, one generation at a time (torch already uses every core).
+# spaCy parses and SBERT encodes of concurrent requests are serialized by
+# quiz_api.nlp_lock and embedding_service.encode_lock.
+GENERATION_SLOTS = int(os.environ.get(
+    "QUIZ_GENERATION_SLOTS", "4" if batching.BATCHING_ENABLED else "1"
+))
+model_lock = threading.BoundedSemaphore(GENERATION_SLOTS)
+
+
+def load_models():
+    global quiz_api
+    start = time.perf_counter()
+    try:
+        import quiz_api as loaded
+        quiz_api = loaded
+        state["cold_start_seconds"] = round(time.perf_counter() - start, 3)
+        state["ready"] = True
+        print(f"Models loaded (cold start {state['cold_start_seconds']}s)", flush=True)
+    except Exception as e:
+        state["error"] = str(e)
+        print(f"Failed to load models: {e}", flush=True)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load in the background so /health answers while the models warm up
+    threading.Thread(target=load_models, daemon=True).start()
+    yield
+
+
+app = FastAPI(title="Quiz worker", lifespan=lifespan)
+
+
+class TextQuizRequest(BaseModel):
+    text: str
+    top_n: int = 4
+    # Share of each question type, e.g. {"mcq": 60, "cloze": 20, "short": 20}
+    # or "mcq:60,cloze:20,short:20" (default QUIZ_TYPE_MIX)
+    type_mix: Optional[Union[Dict[str, float], str]] = None
+
+
+class PdfQuizRequest(BaseModel):
+    pdf_path: str
+    total_questions: int = 20
+    max_words_per_context: int = 200
+    # Draw the quiz from one section ("Chương 1 / 1.2" keeps its subsections)
+    # and/or a sample of the stored contexts (diverse=True spreads it out)
+    section: Optional[str] = None
+    sample: Optional[int] = Field(default=None, ge=0)
+    diverse: bool = False
+    type_mix: Optional[Union[Dict[str, float], str]] = None
+
+
+class ExtractRequest(BaseModel):
+    pdf_path: str
+    max_words: int = 200
+    ocr_lang: str = "eng"
+    # Write contexts to the context store section by section instead of
+    # returning them (bounded memory for very large PDFs)
+    stream: bool = False
+
+
+def require_ready():
+    if state["error"]:
+        raise HTTPException(status_code=500, detail=f"Model loading failed: {state['error']}")
+    if not state["ready"]:
+        raise HTTPException(status_code=503, detail="Models are still loading")
+
+
+def require_type_mix(req):
+    try:
+        return quiz_api.parse_type_mix(req.type_mix)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def record_warm(elapsed):
+    state["warm_requests"] += 1
+    state["warm_total_seconds"] += elapsed
+    state["warm_last_seconds"] = round(elapsed, 3)
+    return {
+        "cold_start_seconds": state["cold_start_seconds"],
+        "warm_seconds": round(elapsed, 3)
+    }
+
+
+@app.get("/health")
+def health():
+    count = state["warm_requests"]
+    return {
+        "status": "ok",
+        "ready": state["ready"],
+        "error": state["error"],
+        "uptime_seconds": round(time.time() - state["started_at"], 1),
+        "cold_start_seconds": state["cold_start_seconds"],
+        "warm_requests": count,
+        "warm_avg_seconds": round(state["warm_total_seconds"] / count, 3) if count else None,
+        "warm_last_seconds": state["warm_last_seconds"],
+        "generation_slots": GENERATION_SLOTS,
+        "batching": quiz_api.generation_batcher.stats if quiz_api else None,
+        "prompt_tokens": prompt_tokens.truncation_report(),
+        "answers": quiz_api.answer_stats if quiz_api else None,
+        "distractors": quiz_api.distractor_stats if quiz_api else None,
+        "context_store": context_store.store_stats(),
+    }
+
+
+@app.get("/ready")
+def ready():
+    require_ready()
+    return {"ready": True}
+
+
+@app.post("/quiz/text")
+def quiz_from_text(req: TextQuizRequest):
+    require_ready()
+    type_mix = require_type_mix(req)
+    start = time.perf_counter()
+    with model_lock:
+        questions = quiz_api.generate_questions(req.text, top_n=req.top_n, type_mix=type_mix)
+    return {"questions": questions, "timing": record_warm(time.perf_counter() - start)}
+
+
+@app.post("/quiz/pdf")
+def quiz_from_pdf(req: PdfQuizRequest):
+    require_ready()
+    type_mix = require_type_mix(req)
+    start = time.perf_counter()
+    with model_lock:
+        # Same steps as generate_quiz_from_pdf, keeping the document for its doc_id
+        document = quiz_api.process_pdf_to_document(req.pdf_path, max_words=req.max_words_per_context)
+        selected = quiz_api.select_document(document, section=req.section, sample=req.sample, diverse=req.diverse)
+        quiz = list(quiz_api.iter_quiz_from_document(
+            selected, total_questions=req.total_questions, type_mix=type_mix
+        ))
+    questions = [quiz_api.to_backend_item(item) for item in quiz]
+    return {
+        "doc_id": document["id"],
+        "questions": questions,
+        "timing": record_warm(time.perf_counter() - start)
+    }
+
+
+def ndjson_stream(make_items):
+    """
+    NDJSON lines: one {"event": "question"} per item as it is produced, then a
+    final {"event": "done"} (or {"event": "error"}) with timing.
+    """
+    start = time.perf_counter()
+    first = None
+    count = 0
+    try:
+        with model_lock:
+            for item in make_items():
+                if first is None:
+                    first = round(time.perf_counter() - start, 3)
+                yield json.dumps({"event": "question", "index": count, "question": item}, ensure_ascii=False) + "\n"
+                count += 1
+    except Exception as e:
+        yield json.dumps({"event": "error", "message": str(e)}, ensure_ascii=False) + "\n"
+        return
+
+    timing = record_warm(time.perf_counter() - start)
+    timing["first_question_seconds"] = first
+    yield json.dumps({"event": "done", "total": count, "timing": timing}) + "\n"
+
+
+@app.post("/quiz/text/stream")
+def quiz_from_text_stream(req: TextQuizRequest):
+    require_ready()
+    type_mix = require_type_mix(req)
+    return StreamingResponse(
+        ndjson_stream(lambda: quiz_api.iter_questions(req.text, top_n=req.top_n, type_mix=type_mix)),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.post("/quiz/pdf/stream")
+def quiz_from_pdf_stream(req: PdfQuizRequest):
+    require_ready()
+    type_mix = require_type_mix(req)
+
+    def items():
+        for item in quiz_api.iter_quiz_from_pdf(
+            req.pdf_path,
+            total_questions=req.total_questions,
+            max_words_per_context=req.max_words_per_context,
+            section=req.section,
+            sample=req.sample,
+            diverse=req.diverse,
+            type_mix=type_mix
+        ):
+            yield quiz_api.to_backend_item(item)
+
+    return StreamingResponse(ndjson_stream(items), media_type="application/x-ndjson")
+
+
+@app.post("/extract")
+def extract(req: ExtractRequest):
+    require_ready()
+    start = time.perf_counter()
+    if req.stream:
+        import extract_text
+        result = extract_text.stream_pdf_to_store(
+            req.pdf_path,
+            max_words=req.max_words,
+            ocr_lang=req.ocr_lang
+        )
+        return {**result, "timing": record_warm(time.perf_counter() - start)}
+
+    document = quiz_api.process_pdf_to_document(
+        req.pdf_path,
+        max_words=req.max_words,
+        ocr_lang=req.ocr_lang
+    )
+    contexts = [ctx["text"] for ctx in document["contexts"]]
+    return {
+        "doc_id": document["id"],
+        "contexts": contexts,
+        "text": "\n\n".join(contexts),
+        "timing": record_warm(time.perf_counter() - start)
+    }
+
+
+@app.get("/documents/{doc_id}/sections")
+def document_sections(doc_id: str):
+    """Section titles of a stored document, for picking PdfQuizRequest.section."""
+    if context_store.document_counts(doc_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown document")
+    return {
+        "doc_id": doc_id,
+        "sections": [
+            {"title": title, "contexts": count, "page": page}
+            for title, count, page in context_store.list_sections(doc_id)
+        ]
+    }
+
+
+def run_pdf_job(req: PdfQuizRequest):
+    def run(job):
+        start = time.perf_counter()
+        quiz_jobs.update(job, stage="extracting")
+        # Extraction runs outside the model lock so it overlaps another job's generation
+        document = quiz_api.process_pdf_to_document(
+            req.pdf_path,
+            max_words=req.max_words_per_context,
+            progress=lambda **counts: quiz_jobs.update(job, **counts)
+        )
+        document = quiz_api.select_document(document, section=req.section, sample=req.sample, diverse=req.diverse)
+
+        questions = []
+        quiz_jobs.update(job, stage="waiting", questions=0, questions_total=req.total_questions)
+        with model_lock:
+            quiz_jobs.update(job, stage="generating")
+            for item in quiz_api.iter_quiz_from_document(
+                document, total_questions=req.total_questions, type_mix=req.type_mix
+            ):
+                questions.append(quiz_api.to_backend_item(item))
+                quiz_jobs.update(job, questions=len(questions))
+
+        return {
+            "doc_id": document["id"],
+            "questions": questions,
+            "timing": record_warm(time.perf_counter() - start)
+        }
+    return run
+
+
+def run_text_job(req: TextQuizRequest):
+    def run(job):
+        start = time.perf_counter()
+        questions = []
+        quiz_jobs.update(job, stage="waiting", questions=0, questions_total=req.top_n)
+        with model_lock:
+            quiz_jobs.update(job, stage="generating")
+            for item in quiz_api.iter_questions(
+                req.text, top_n=req.top_n, context_window=quiz_api.QAG_CONTEXT_WINDOW, type_mix=req.type_mix
+            ):
+                questions.append(item)
+                quiz_jobs.update(job, questions=len(questions))
+
+        return {"questions": questions, "timing": record_warm(time.perf_counter() - start)}
+    return run
+
+
+def submit(kind, run, params):
+    require_ready()
+    try:
+        return quiz_jobs.submit_job(kind, run, params)
+    except quiz_jobs.QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Job queue is full: {e}")
+
+
+def require_job(job_id):
+    job = quiz_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/jobs/pdf", status_code=202)
+def submit_pdf_job(req: PdfQuizRequest):
+    require_ready()
+    req.type_mix = require_type_mix(req)
+    return submit("pdf", run_pdf_job(req), {
+        "pdf_path": req.pdf_path,
+        "total_questions": req.total_questions,
+        "max_words_per_context": req.max_words_per_context,
+        "section": req.section,
+        "sample": req.sample,
+        "diverse": req.diverse,
+        "type_mix": req.type_mix
+    })
+
+
+@app.post("/jobs/text", status_code=202)
+def submit_text_job(req: TextQuizRequest):
+    require_ready()
+    req.type_mix = require_type_mix(req)
+    return submit("text", run_text_job(req), {"top_n": req.top_n, "type_mix": req.type_mix})
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return require_job(job_id)
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    require_job(job_id)
+    status, result = quiz_jobs.get_result(job_id)
+    if status == "done":
+        return result
+    if status == "failed":
+        raise HTTPException(status_code=500, detail=require_job(job_id)["error"])
+    if status == "cancelled":
+        raise HTTPException(status_code=410, detail="Job was cancelled")
+    raise HTTPException(status_code=409, detail=f"Job is {status}")
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    require_job(job_id)
+    return quiz_jobs.cancel_job(job_id)
+
+
+def sse_job_events(job_id):
+    """
+    Server-sent events: a "progress" event with the job snapshot on every
+    change, then one final "done" / "failed" / "cancelled" event.
+    """
+    job = quiz_jobs.get_job(job_id)
+    while job is not None:
+        event = job["status"] if job["status"] in quiz_jobs.FINISHED else "progress"
+        yield f"event: {event}\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+        if event != "progress":
+            return
+
+        version = job["version"]
+        job = quiz_jobs.wait_for_change(job_id, version)
+        while job is not None and job["version"] == version:
+            # Comment line keeps proxies from closing an idle connection
+            yield ": keep-alive\n\n"
+            job = quiz_jobs.wait_for_change(job_id, version)
+
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str):
+    require_job(job_id)
+    return StreamingResponse(
+        sse_job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=os.environ.get("QUIZ_WORKER_HOST", "127.0.0.1"),
+        port=int(os.environ.get("QUIZ_WORKER_PORT", "8001"))
+    )
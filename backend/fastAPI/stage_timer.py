@@ -0,0 +1,16 @@
+"""Optional per-stage wall-clock accounting for the PDF -> quiz pipeline."""
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def timed(timings, stage):
+    """Add the block's duration to timings[stage]; a no-op when timings is None."""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
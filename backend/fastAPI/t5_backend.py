@@ -0,0 +1,160 @@
+"""
+Model paths and inference backends for the T5 models used by quiz_api.
+
+QUIZ_T5_BACKEND selects how a checkpoint is loaded:
+- "torch": full-precision PyTorch eager mode (default)
+- "int8":  PyTorch dynamic int8 quantization of the Linear layers (CPU only)
+- "onnx":  ONNX Runtime through optimum; the exported encoder/decoder
+           sessions are saved under ONNX_CACHE_DIR and reused on later loads
+
+QUIZ_DISTRACTOR_MODEL selects where distractors come from:
+- "separate": a second flan-t5-large (DIST_MODEL_PATH), the original setup
+- "shared":   the already-loaded QAG model, so a worker holds one T5
+- "adapter":  a LoRA adapter (QUIZ_DISTRACTOR_ADAPTER, trained on the QAG
+              checkpoint) layered on the QAG model with peft; question
+              generation runs with the adapter disabled
+"""
+import os
+import re
+
+import torch
+from transformers import T5ForConditionalGeneration, T5Tokenizer
+
+# QAG model (FINETUNED)
+QAG_MODEL_PATH = "E:\code\backend\fastAPI\flan-t5-large"
+QAG_TOKENIZER_PATH = "./flan-t5-large"
+
+# Distractor model (BASE)
+DIST_MODEL_PATH = "google/flan-t5-large"
+
+T5_BACKEND = os.environ.get("QUIZ_T5_BACKEND", "torch")
+T5_BACKENDS = ["torch", "int8", "onnx"]
+DISTRACTOR_MODEL_MODE = os.environ.get("QUIZ_DISTRACTOR_MODEL", "separate")
+DISTRACTOR_MODEL_MODES = ["separate", "shared", "adapter"]
+DISTRACTOR_ADAPTER_PATH = os.environ.get("QUIZ_DISTRACTOR_ADAPTER")
+
+ONNX_CACHE_DIR = os.environ.get(
+    "QUIZ_ONNX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "onnx")
+)
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+# Decoding settings for question generation (shared with the benchmarks)
+QAG_GENERATE_KWARGS = {
+    "max_new_tokens": 64,
+    "num_beams": 4,
+    "early_stopping": True
+}
+
+
+def load_torch(model_path, device=device):
+    model = T5ForConditionalGeneration.from_pretrained(model_path).to(device)
+    model.eval()
+    return model
+
+
+def load_int8(model_path):
+    # Dynamic quantization only has CPU kernels
+    model = load_torch(model_path, device="cpu")
+    return torch.quantization.quantize_dynamic(
+        model,
+        {torch.nn.Linear},
+        dtype=torch.qint8
+    )
+
+
+def load_onnx(model_path):
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError:
+        raise RuntimeError(
+            "QUIZ_T5_BACKEND=onnx needs optimum with ONNX Runtime: "
+            "pip install optimum[onnxruntime]"
+        )
+
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_path).strip("_")
+    export_dir = os.path.join(ONNX_CACHE_DIR, name)
+
+    if os.path.isfile(os.path.join(export_dir, "config.json")):
+        return ORTModelForSeq2SeqLM.from_pretrained(export_dir, use_cache=True)
+
+    print(f"Exporting {model_path} to ONNX (one-time) -> {export_dir}")
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_path, export=True, use_cache=True)
+    model.save_pretrained(export_dir)
+    return model
+
+
+def load_t5(model_path, backend=None):
+    """Load a T5 seq2seq model with the configured backend; all support .generate()."""
+    backend = backend or T5_BACKEND
+    if backend == "torch":
+        return load_torch(model_path)
+    if backend == "int8":
+        return load_int8(model_path)
+    if backend == "onnx":
+        return load_onnx(model_path)
+    raise ValueError(f"Unknown QUIZ_T5_BACKEND '{backend}', expected one of {T5_BACKENDS}")
+
+
+class AdapterView:
+    """
+    One peft model seen as two: generate() runs with the LoRA adapter on
+    (distractors) or off (questions). Callers must not generate with both
+    views at the same time, since toggling the adapter is global state.
+    """
+
+    def __init__(self, peft_model, adapter_enabled):
+        self.model = peft_model
+        self.adapter_enabled = adapter_enabled
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def generate(self, **kwargs):
+        if self.adapter_enabled:
+            return self.model.generate(**kwargs)
+        with self.model.disable_adapter():
+            return self.model.generate(**kwargs)
+
+
+def load_quiz_models(mode=None, backend=None):
+    """
+    Load the QAG and distractor models according to QUIZ_DISTRACTOR_MODEL.
+    Returns (qag_tokenizer, qag_model, dist_tokenizer, dist_model).
+    """
+    mode = mode or DISTRACTOR_MODEL_MODE
+    backend = backend or T5_BACKEND
+
+    qag_tokenizer = T5Tokenizer.from_pretrained(QAG_TOKENIZER_PATH)
+    qag_model = load_t5(QAG_MODEL_PATH, backend=backend)
+
+    if mode == "separate":
+        dist_tokenizer = T5Tokenizer.from_pretrained(DIST_MODEL_PATH)
+        dist_model = load_t5(DIST_MODEL_PATH, backend=backend)
+        return qag_tokenizer, qag_model, dist_tokenizer, dist_model
+
+    if mode == "shared":
+        return qag_tokenizer, qag_model, qag_tokenizer, qag_model
+
+    if mode == "adapter":
+        if backend != "torch":
+            raise ValueError("QUIZ_DISTRACTOR_MODEL=adapter needs QUIZ_T5_BACKEND=torch")
+        if not DISTRACTOR_ADAPTER_PATH:
+            raise ValueError("QUIZ_DISTRACTOR_MODEL=adapter needs QUIZ_DISTRACTOR_ADAPTER")
+        try:
+            from peft import PeftModel
+        except ImportError:
+            raise RuntimeError("QUIZ_DISTRACTOR_MODEL=adapter needs peft: pip install peft")
+
+        peft_model = PeftModel.from_pretrained(qag_model, DISTRACTOR_ADAPTER_PATH)
+        peft_model.eval()
+        return (
+            qag_tokenizer, AdapterView(peft_model, adapter_enabled=False),
+            qag_tokenizer, AdapterView(peft_model, adapter_enabled=True)
+        )
+
+    raise ValueError(
+        f"Unknown QUIZ_DISTRACTOR_MODEL '{mode}', expected one of {DISTRACTOR_MODEL_MODES}"
+    )
@@ -85,7 +85,209 @@ async function qgFromFile(req, res, next) {
   }
 }
 
+/**
+ * Pipe quiz events to the client as NDJSON, one JSON object per line.
+ * Errors before the first event go through the normal error handler;
+ * later errors are sent as a final {event: 'error'} line.
+ */
+async function streamQuizEvents(res, next, run) {
+  const writeEvent = (event) => {
+    if (!res.headersSent) {
+      res.status(200).set({
+        "Content-Type": "application/x-ndjson",
+        "Cache-Control": "no-cache",
+      });
+      res.flushHeaders();
+    }
+    res.write(JSON.stringify(event) + "\n");
+  };
+
+  try {
+    await run(writeEvent);
+    return res.end();
+  } catch (error) {
+    console.log(error);
+    if (!res.headersSent) {
+      return next(
+        new ApiError(
+          error.status || 500,
+          error.message || "Unknown error occurred while streaming quiz"
+        )
+      );
+    }
+    writeEvent({ event: "error", message: error.message });
+    return res.end();
+  }
+}
+
+/**
+ * POST /api/qg/text/stream
+ * Body: { text: string, numQuestions?: number }
+ */
+async function qgFromTextStream(req, res, next) {
+  const { text, numQuestions } = req.body || {};
+
+  if (!text || !text.trim()) {
+    return next(new ApiError(400, "Field 'text' is required"));
+  }
+
+  return streamQuizEvents(res, next, (onEvent) =>
+    qagService.streamFromText(text, numQuestions, onEvent)
+  );
+}
+
+/**
+ * POST /api/qg/file/stream
+ * multipart/form-data, fields: file, numQuestions (optional)
+ */
+async function qgFromFileStream(req, res, next) {
+  const file = req.file;
+
+  if (!file) {
+    return next(new ApiError(400, "Field 'file' is required"));
+  }
+
+  const numQuestions = req.body.numQuestions
+    ? parseInt(req.body.numQuestions, 10)
+    : undefined;
+
+  if (numQuestions !== undefined && (isNaN(numQuestions) || numQuestions < 1 || numQuestions > 50)) {
+    return next(new ApiError(400, "numQuestions must be between 1 and 50"));
+  }
+
+  return streamQuizEvents(res, next, (onEvent) =>
+    qagService.streamFromFile(file, numQuestions, onEvent)
+  );
+}
+
+function jobError(next, error, fallback) {
+  console.log(error);
+  return next(new ApiError(error.status || 500, error.message || fallback));
+}
+
+/**
+ * POST /api/qg/jobs/text
+ * Body: { text: string, numQuestions?: number }
+ */
+async function qgJobFromText(req, res, next) {
+  const { text, numQuestions } = req.body || {};
+
+  if (!text || !text.trim()) {
+    return next(new ApiError(400, "Field 'text' is required"));
+  }
+
+  try {
+    const job = await qagService.submitJobFromText(text, numQuestions);
+    return res.status(202).json(JSend.success({ job }));
+  } catch (error) {
+    return jobError(next, error, "Unknown error occurred while queueing quiz job");
+  }
+}
+
+/**
+ * POST /api/qg/jobs/file
+ * multipart/form-data, fields: file, numQuestions (optional)
+ */
+async function qgJobFromFile(req, res, next) {
+  const file = req.file;
+
+  if (!file) {
+    return next(new ApiError(400, "Field 'file' is required"));
+  }
+
+  const numQuestions = req.body.numQuestions
+    ? parseInt(req.body.numQuestions, 10)
+    : undefined;
+
+  if (numQuestions !== undefined && (isNaN(numQuestions) || numQuestions < 1 || numQuestions > 50)) {
+    return next(new ApiError(400, "numQuestions must be between 1 and 50"));
+  }
+
+  try {
+    const job = await qagService.submitJobFromFile(file, numQuestions);
+    return res.status(202).json(JSend.success({ job }));
+  } catch (error) {
+    return jobError(next, error, "Unknown error occurred while queueing quiz job");
+  }
+}
+
+/**
+ * GET /api/qg/jobs/:id
+ */
+async function qgJobStatus(req, res, next) {
+  try {
+    const job = await qagService.getJob(req.params.id);
+    return res.status(200).json(JSend.success({ job }));
+  } catch (error) {
+    return jobError(next, error, "Unknown error occurred while reading quiz job");
+  }
+}
+
+/**
+ * GET /api/qg/jobs/:id/result
+ */
+async function qgJobResult(req, res, next) {
+  try {
+    const result = await qagService.getJobResult(req.params.id);
+    return res.status(200).json(
+      JSend.success({
+        quiz: { questions: result.questions },
+      })
+    );
+  } catch (error) {
+    return jobError(next, error, "Unknown error occurred while reading quiz job result");
+  }
+}
+
+/**
+ * DELETE /api/qg/jobs/:id
+ */
+async function qgJobCancel(req, res, next) {
+  try {
+    const job = await qagService.cancelJob(req.params.id);
+    return res.status(200).json(JSend.success({ job }));
+  } catch (error) {
+    return jobError(next, error, "Unknown error occurred while cancelling quiz job");
+  }
+}
+
+/**
+ * GET /api/qg/jobs/:id/events
+ * Server-sent events relayed from the worker: "progress" on every change,
+ * then a final "done", "failed" or "cancelled" event.
+ */
+async function qgJobEvents(req, res, next) {
+  try {
+    await qagService.pipeJobEvents(req.params.id, (chunk) => {
+      if (!res.headersSent) {
+        res.status(200).set({
+          "Content-Type": "text/event-stream",
+          "Cache-Control": "no-cache",
+          Connection: "keep-alive",
+        });
+        res.flushHeaders();
+      }
+      res.write(chunk);
+    });
+    return res.end();
+  } catch (error) {
+    if (!res.headersSent) {
+      return jobError(next, error, "Unknown error occurred while streaming quiz job events");
+    }
+    console.log(error);
+    return res.end();
+  }
+}
+
 module.exports = {
   qgFromText,
   qgFromFile,
+  qgFromTextStream,
+  qgFromFileStream,
+  qgJobFromText,
+  qgJobFromFile,
+  qgJobStatus,
+  qgJobResult,
+  qgJobCancel,
+  qgJobEvents,
 };
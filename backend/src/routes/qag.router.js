@@ -125,6 +125,226 @@ module.exports.setup = (app) => {
    */
   qagRouter.post("/file", upload.single("file"), qagController.qgFromFile);
 
+  /**
+   * @swagger
+   * /api/v1/qg/text/stream:
+   *   post:
+   *     summary: Stream quiz generation from raw text
+   *     description: Same input as /qg/text, but questions are streamed as NDJSON lines as soon as each one is generated. Each line is {event, index, question}, followed by a final {event: done, total} or {event: error, message}.
+   *     tags:
+   *       - qag
+   *     requestBody:
+   *       required: true
+   *       content:
+   *         application/json:
+   *           schema:
+   *             type: object
+   *             properties:
+   *               text:
+   *                 type: string
+   *               numQuestions:
+   *                 type: integer
+   *     responses:
+   *       200:
+   *         description: NDJSON stream of quiz events
+   *         content:
+   *           application/x-ndjson:
+   *             schema:
+   *               type: string
+   *       400:
+   *         description: Bad Request
+   *         $ref: '#/components/responses/400BadRequest'
+   */
+  qagRouter.post("/text/stream", qagController.qgFromTextStream);
+
+  /**
+   * @swagger
+   * /api/v1/qg/file/stream:
+   *   post:
+   *     summary: Stream quiz generation from an uploaded file
+   *     description: Same input as /qg/file, but questions are streamed as NDJSON lines as soon as each one is generated.
+   *     tags:
+   *       - qag
+   *     requestBody:
+   *       required: true
+   *       content:
+   *         multipart/form-data:
+   *           schema:
+   *             type: object
+   *             properties:
+   *               file:
+   *                 type: string
+   *                 format: binary
+   *               numQuestions:
+   *                 type: integer
+   *     responses:
+   *       200:
+   *         description: NDJSON stream of quiz events
+   *         content:
+   *           application/x-ndjson:
+   *             schema:
+   *               type: string
+   *       400:
+   *         description: Bad Request
+   *         $ref: '#/components/responses/400BadRequest'
+   */
+  qagRouter.post("/file/stream", upload.single("file"), qagController.qgFromFileStream);
+
+  /**
+   * @swagger
+   * /api/v1/qg/jobs/text:
+   *   post:
+   *     summary: Queue quiz generation from raw text
+   *     description: Returns a job (202) right away. Follow it with GET /qg/jobs/{id} or /qg/jobs/{id}/events and fetch the questions from /qg/jobs/{id}/result.
+   *     tags:
+   *       - qag
+   *     requestBody:
+   *       required: true
+   *       content:
+   *         application/json:
+   *           schema:
+   *             type: object
+   *             properties:
+   *               text:
+   *                 type: string
+   *               numQuestions:
+   *                 type: integer
+   *     responses:
+   *       202:
+   *         description: Queued job ({id, status, progress})
+   *       400:
+   *         description: Bad Request
+   *         $ref: '#/components/responses/400BadRequest'
+   *       429:
+   *         description: Job queue is full
+   *       503:
+   *         description: Quiz worker unavailable or still loading
+   */
+  qagRouter.post("/jobs/text", qagController.qgJobFromText);
+
+  /**
+   * @swagger
+   * /api/v1/qg/jobs/file:
+   *   post:
+   *     summary: Queue quiz generation from an uploaded file
+   *     description: Same input as /qg/file; returns a job (202) right away. Progress reports pages extracted, contexts built and questions generated.
+   *     tags:
+   *       - qag
+   *     requestBody:
+   *       required: true
+   *       content:
+   *         multipart/form-data:
+   *           schema:
+   *             type: object
+   *             properties:
+   *               file:
+   *                 type: string
+   *                 format: binary
+   *               numQuestions:
+   *                 type: integer
+   *     responses:
+   *       202:
+   *         description: Queued job ({id, status, progress})
+   *       400:
+   *         description: Bad Request
+   *         $ref: '#/components/responses/400BadRequest'
+   *       429:
+   *         description: Job queue is full
+   *       503:
+   *         description: Quiz worker unavailable or still loading
+   */
+  qagRouter.post("/jobs/file", upload.single("file"), qagController.qgJobFromFile);
+
+  /**
+   * @swagger
+   * /api/v1/qg/jobs/{id}:
+   *   get:
+   *     summary: Quiz job status and progress
+   *     description: status is queued, running, done, failed or cancelled; progress has stage, pages_done, pages_total, contexts, questions and questions_total when known.
+   *     tags:
+   *       - qag
+   *     parameters:
+   *       - in: path
+   *         name: id
+   *         required: true
+   *         schema:
+   *           type: string
+   *     responses:
+   *       200:
+   *         description: Job snapshot
+   *       404:
+   *         description: Unknown job
+   *   delete:
+   *     summary: Cancel a quiz job
+   *     description: Queued jobs are dropped; running jobs stop at the next page range or question.
+   *     tags:
+   *       - qag
+   *     parameters:
+   *       - in: path
+   *         name: id
+   *         required: true
+   *         schema:
+   *           type: string
+   *     responses:
+   *       200:
+   *         description: Job snapshot
+   *       404:
+   *         description: Unknown job
+   */
+  qagRouter.get("/jobs/:id", qagController.qgJobStatus);
+  qagRouter.delete("/jobs/:id", qagController.qgJobCancel);
+
+  /**
+   * @swagger
+   * /api/v1/qg/jobs/{id}/events:
+   *   get:
+   *     summary: Subscribe to quiz job progress
+   *     description: Server-sent events; a "progress" event carries the job snapshot on every change, followed by a final "done", "failed" or "cancelled" event.
+   *     tags:
+   *       - qag
+   *     parameters:
+   *       - in: path
+   *         name: id
+   *         required: true
+   *         schema:
+   *           type: string
+   *     responses:
+   *       200:
+   *         description: Event stream
+   *         content:
+   *           text/event-stream:
+   *             schema:
+   *               type: string
+   *       404:
+   *         description: Unknown job
+   */
+  qagRouter.get("/jobs/:id/events", qagController.qgJobEvents);
+
+  /**
+   * @swagger
+   * /api/v1/qg/jobs/{id}/result:
+   *   get:
+   *     summary: Fetch the quiz produced by a finished job
+   *     tags:
+   *       - qag
+   *     parameters:
+   *       - in: path
+   *         name: id
+   *         required: true
+   *         schema:
+   *           type: string
+   *     responses:
+   *       200:
+   *         description: Generated quiz, same shape as /qg/file
+   *       404:
+   *         description: Unknown job
+   *       409:
+   *         description: Job has not finished yet
+   *       410:
+   *         description: Job was cancelled
+   */
+  qagRouter.get("/jobs/:id/result", qagController.qgJobResult);
+
   // method không hỗ trợ
   // qagRouter.all("*", methodNotAllowed);
 };
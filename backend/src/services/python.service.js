@@ -5,6 +5,53 @@ const fs = require('fs').promises;
 
 const execAsync = promisify(exec);
 
+// Long-lived Python worker (fastAPI/quiz_server.py). Set QUIZ_WORKER_URL=off to
+// always spawn a fresh Python process per request.
+const WORKER_URL = process.env.QUIZ_WORKER_URL || 'http://127.0.0.1:8001';
+const WORKER_TIMEOUT_MS = parseInt(process.env.QUIZ_WORKER_TIMEOUT_MS || '600000', 10);
+
+/**
+ * POST a job to the Python worker.
+ * Returns null when the worker is disabled, unreachable or still loading,
+ * so callers can fall back to spawning a Python process.
+ * @param {string} route - Worker route, e.g. '/quiz/text'
+ * @param {object} payload - JSON body
+ * @returns {Promise<object|null>} Worker response body
+ */
+async function callWorker(route, payload) {
+  if (WORKER_URL === 'off') return null;
+
+  let resp;
+  try {
+    resp = await fetch(`${WORKER_URL}${route}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(payload),
+      signal: AbortSignal.timeout(WORKER_TIMEOUT_MS)
+    });
+  } catch (error) {
+    console.warn(`Quiz worker unavailable (${error.message}), falling back to Python process`);
+    return null;
+  }
+
+  if (resp.status === 503) {
+    console.warn('Quiz worker is still loading models, falling back to Python process');
+    return null;
+  }
+
+  const data = await resp.json().catch(() => null);
+  if (!resp.ok) {
+    const err = new Error((data && data.detail) || `Quiz worker error ${resp.status}`);
+    err.status = 500;
+    throw err;
+  }
+
+  if (data && data.timing) {
+    console.log(`Quiz worker ${route}: warm ${data.timing.warm_seconds}s (cold start ${data.timing.cold_start_seconds}s)`);
+  }
+  return data;
+}
+
 /**
  * Extract text from PDF using Python script
  * @param {string} pdfPath - Path to PDF file
@@ -12,6 +59,11 @@ const execAsync = promisify(exec);
  */
 async function extractTextFromPDF(pdfPath) {
   try {
+    const fromWorker = await callWorker('/extract', { pdf_path: pdfPath });
+    if (fromWorker && fromWorker.text && fromWorker.text.trim()) {
+      return fromWorker.text.trim();
+    }
+
     const scriptPath = path.join(__dirname, '../../fastAPI/extract_text.py');
     // Try python3 first, fallback to python
     const pythonCmd = process.platform === 'win32' ? 'python' : 'python3';
@@ -53,6 +105,11 @@ async function extractTextFromPDF(pdfPath) {
  */
 async function generateQuizFromText(text, topN = 4) {
   try {
+    const fromWorker = await callWorker('/quiz/text', { text, top_n: topN });
+    if (fromWorker) {
+      return fromWorker.questions;
+    }
+
     const scriptDir = path.join(__dirname, '../../fastAPI');
     const tempFile = path.join(__dirname, '../../temp_input.txt');
 
@@ -112,8 +169,152 @@ async function generateQuizFromText(text, topN = 4) {
   }
 }
 
+/**
+ * Stream quiz questions from the Python worker as they are generated.
+ * The worker answers with NDJSON events: {event: 'question'|'done'|'error'}.
+ * Without a worker, the quiz is generated in one go and replayed as events.
+ * @param {{text?: string, pdfPath?: string}} source - Raw text or a PDF path
+ * @param {number} topN - Number of questions to generate
+ * @param {(event: object) => void} onEvent - Called for every event
+ * @returns {Promise<void>}
+ */
+async function streamQuiz(source, topN, onEvent) {
+  const route = source.pdfPath ? '/quiz/pdf/stream' : '/quiz/text/stream';
+  const payload = source.pdfPath
+    ? { pdf_path: source.pdfPath, total_questions: topN }
+    : { text: source.text, top_n: topN };
+
+  let resp = null;
+  if (WORKER_URL !== 'off') {
+    try {
+      resp = await fetch(`${WORKER_URL}${route}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload),
+        signal: AbortSignal.timeout(WORKER_TIMEOUT_MS)
+      });
+    } catch (error) {
+      console.warn(`Quiz worker unavailable (${error.message}), streaming from a full Python run`);
+    }
+  }
+
+  if (!resp || resp.status === 503) {
+    const text = source.pdfPath ? await extractTextFromPDF(source.pdfPath) : source.text;
+    const questions = await generateQuizFromText(text, topN);
+    questions.forEach((question, index) => onEvent({ event: 'question', index, question }));
+    onEvent({ event: 'done', total: questions.length });
+    return;
+  }
+
+  if (!resp.ok) {
+    const data = await resp.json().catch(() => null);
+    const err = new Error((data && data.detail) || `Quiz worker error ${resp.status}`);
+    err.status = 500;
+    throw err;
+  }
+
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for await (const chunk of resp.body) {
+    buffer += decoder.decode(chunk, { stream: true });
+    let newline;
+    while ((newline = buffer.indexOf('\n')) >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      if (line) onEvent(JSON.parse(line));
+    }
+  }
+  if (buffer.trim()) onEvent(JSON.parse(buffer));
+}
+
+/**
+ * Call a worker job route. Jobs only exist inside the long-lived worker,
+ * so an unavailable worker is an error (503) instead of a fallback.
+ * @param {string} method - HTTP method
+ * @param {string} route - Worker route, e.g. '/jobs/pdf'
+ * @param {object} [payload] - JSON body
+ * @returns {Promise<Response>} Worker response (status checked)
+ */
+async function jobRequest(method, route, payload) {
+  if (WORKER_URL === 'off') {
+    const err = new Error('Quiz jobs need the quiz worker (QUIZ_WORKER_URL is off)');
+    err.status = 503;
+    throw err;
+  }
+
+  let resp;
+  try {
+    resp = await fetch(`${WORKER_URL}${route}`, {
+      method,
+      headers: payload ? { 'Content-Type': 'application/json' } : undefined,
+      body: payload ? JSON.stringify(payload) : undefined
+    });
+  } catch (error) {
+    const err = new Error(`Quiz worker unavailable: ${error.message}`);
+    err.status = 503;
+    throw err;
+  }
+
+  if (!resp.ok) {
+    const data = await resp.json().catch(() => null);
+    const err = new Error((data && data.detail) || `Quiz worker error ${resp.status}`);
+    // 404 unknown job, 409 not finished, 410 cancelled, 429 queue full, 503 loading
+    err.status = resp.status;
+    throw err;
+  }
+  return resp;
+}
+
+/**
+ * Queue a quiz job on the worker.
+ * @param {{text?: string, pdfPath?: string}} source - Raw text or a PDF path
+ * @param {number} topN - Number of questions to generate
+ * @returns {Promise<object>} Job snapshot ({id, status, progress, ...})
+ */
+async function submitQuizJob(source, topN) {
+  const resp = source.pdfPath
+    ? await jobRequest('POST', '/jobs/pdf', { pdf_path: source.pdfPath, total_questions: topN })
+    : await jobRequest('POST', '/jobs/text', { text: source.text, top_n: topN });
+  return resp.json();
+}
+
+async function getQuizJob(jobId) {
+  const resp = await jobRequest('GET', `/jobs/${encodeURIComponent(jobId)}`);
+  return resp.json();
+}
+
+async function getQuizJobResult(jobId) {
+  const resp = await jobRequest('GET', `/jobs/${encodeURIComponent(jobId)}/result`);
+  return resp.json();
+}
+
+async function cancelQuizJob(jobId) {
+  const resp = await jobRequest('DELETE', `/jobs/${encodeURIComponent(jobId)}`);
+  return resp.json();
+}
+
+/**
+ * Relay the worker's server-sent progress events for a job.
+ * @param {string} jobId - Job id
+ * @param {(chunk: string) => void} onChunk - Called with raw SSE text
+ * @returns {Promise<void>} Resolves when the job has finished
+ */
+async function pipeQuizJobEvents(jobId, onChunk) {
+  const resp = await jobRequest('GET', `/jobs/${encodeURIComponent(jobId)}/events`);
+  const decoder = new TextDecoder();
+  for await (const chunk of resp.body) {
+    onChunk(decoder.decode(chunk, { stream: true }));
+  }
+}
+
 module.exports = {
   extractTextFromPDF,
   generateQuizFromText,
+  streamQuiz,
+  submitQuizJob,
+  getQuizJob,
+  getQuizJobResult,
+  cancelQuizJob,
+  pipeQuizJobEvents,
 };
 
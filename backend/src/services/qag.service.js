@@ -269,3 +269,67 @@ exports.generateFromFile = async (file, numQuestions) => {
     )
   }
 }
+
+// Streaming variants: questions are passed to onEvent as NDJSON-style events
+// ({event: 'question' | 'done' | 'error'}) as soon as the worker produces them.
+exports.streamFromText = async (text, numQuestions, onEvent) => {
+  await pythonService.streamQuiz({ text }, numQuestions || 5, onEvent)
+}
+
+exports.streamFromFile = async (file, numQuestions, onEvent) => {
+  const uploadPath = path.join(__dirname, '../../uploads', file.filename)
+  const topN = numQuestions || 10
+
+  if (file.mimetype === 'application/pdf') {
+    return pythonService.streamQuiz({ pdfPath: uploadPath }, topN, onEvent)
+  }
+  if (file.mimetype === 'text/plain') {
+    const content = await fs.readFile(uploadPath, 'utf8')
+    if (!content.trim()) {
+      const err = new Error('Could not extract text from file')
+      err.status = 400
+      throw err
+    }
+    return pythonService.streamQuiz({ text: content }, topN, onEvent)
+  }
+
+  const err = new Error('Only PDF or TXT allowed')
+  err.status = 400
+  throw err
+}
+
+// Queued jobs: the worker schedules generation on a bounded pool and reports
+// progress; clients poll the job or subscribe to its events.
+exports.submitJobFromText = async (text, numQuestions) => {
+  return pythonService.submitQuizJob({ text }, numQuestions || 5)
+}
+
+exports.submitJobFromFile = async (file, numQuestions) => {
+  const uploadPath = path.join(__dirname, '../../uploads', file.filename)
+  const topN = numQuestions || 10
+
+  if (file.mimetype === 'application/pdf') {
+    return pythonService.submitQuizJob({ pdfPath: uploadPath }, topN)
+  }
+  if (file.mimetype === 'text/plain') {
+    const content = await fs.readFile(uploadPath, 'utf8')
+    if (!content.trim()) {
+      const err = new Error('Could not extract text from file')
+      err.status = 400
+      throw err
+    }
+    return pythonService.submitQuizJob({ text: content }, topN)
+  }
+
+  const err = new Error('Only PDF or TXT allowed')
+  err.status = 400
+  throw err
+}
+
+exports.getJob = (jobId) => pythonService.getQuizJob(jobId)
+
+exports.getJobResult = (jobId) => pythonService.getQuizJobResult(jobId)
+
+exports.cancelJob = (jobId) => pythonService.cancelQuizJob(jobId)
+
+exports.pipeJobEvents = (jobId, onChunk) => pythonService.pipeQuizJobEvents(jobId, onChunk)